@@ -0,0 +1,205 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import observe_request
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar("current_metrics", default=None)
+
+MAX_SAMPLED_QUERIES = 200
+SQL_SAMPLE_LENGTH = 2000
+
+
+class RequestMetrics:
+    """Query and timing counters of a single request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.action = None
+        self.view_started = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.sql = []
+        self.timings = {"view": 0.0, "serializer": 0.0}
+        self.active = set()
+
+    def execute(self, execute, sql, params, many, context):
+        """``connection.execute_wrapper`` hook counting every query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += elapsed
+            self.statements[sql] += 1
+            if len(self.sql) < MAX_SAMPLED_QUERIES:
+                self.sql.append((sql, elapsed))
+
+    @contextmanager
+    def measure(self, name):
+        """Add the time of the block to ``name``, ignoring nested blocks."""
+        if name in self.active:
+            yield
+            return
+        self.active.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - started
+            self.active.discard(name)
+
+    def get_repeated_statements(self, threshold):
+        return [
+            {"sql": sql[:SQL_SAMPLE_LENGTH], "count": count}
+            for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def get_server_timing(self, total):
+        return ", ".join(
+            (
+                f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} '
+                'queries"',
+                f"view;dur={self.timings['view'] * 1000:.1f}",
+                f"serializer;dur={self.timings['serializer'] * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            )
+        )
+
+
+class SlowRequestSampler:
+    """Tell whether a request is among the slowest of the recent ones."""
+
+    def __init__(self, percent, window=1000, min_samples=100):
+        self.fraction = percent / 100
+        self.min_samples = min_samples
+        self.recent = deque(maxlen=window)
+        self.ordered = []
+        self.lock = threading.Lock()
+
+    def is_slow(self, duration):
+        if self.fraction <= 0:
+            return False
+        with self.lock:
+            if len(self.recent) == self.recent.maxlen:
+                oldest = self.recent[0]
+                del self.ordered[bisect_left(self.ordered, oldest)]
+            self.recent.append(duration)
+            insort(self.ordered, duration)
+            if len(self.ordered) < self.min_samples:
+                return False
+            position = int(len(self.ordered) * (1 - self.fraction))
+            return duration >= self.ordered[position]
+
+
+@contextmanager
+def measure(name):
+    """Add the time of the block to ``name`` of the current request."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.measure(name):
+        yield
+
+
+class RequestMetricsMiddleware:
+    """Report query count, SQL, view and serializer time of each request.
+
+    The numbers go to one JSON log record per request, logged at INFO
+    and so hidden by the default ``REQUEST_METRICS_LOG_LEVEL``, and,
+    with ``REQUEST_METRICS_SERVER_TIMING`` on, to the ``Server-Timing``
+    header. Serializer time covers the blocks views wrap in
+    ``measure("serializer")``. Requests among the slowest
+    ``REQUEST_METRICS_SLOW_PERCENT`` percent also log their SQL, and
+    statements repeated ``REQUEST_METRICS_REPEATED_QUERIES`` times or
+    more are reported as a likely N+1 of the view and action. Queries
+    run while a streaming response is being sent are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.repeated_threshold = settings.REQUEST_METRICS_REPEATED_QUERIES
+        self.sampler = SlowRequestSampler(
+            settings.REQUEST_METRICS_SLOW_PERCENT
+        )
+        self.server_timing = settings.REQUEST_METRICS_SERVER_TIMING
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics.execute):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        total = time.perf_counter() - metrics.started
+        if metrics.view_started is not None:
+            metrics.timings["view"] = (
+                time.perf_counter() - metrics.view_started
+            )
+        if self.server_timing:
+            response["Server-Timing"] = metrics.get_server_timing(total)
+        observe_request(
+            metrics.view,
+            metrics.action,
+            request.method,
+            total,
+            metrics.queries,
+        )
+        self.log(request, response, metrics, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return None
+        view_class = getattr(view_func, "cls", None)
+        metrics.view = (view_class or view_func).__name__
+        actions = getattr(view_func, "actions", None) or {}
+        metrics.action = actions.get(request.method.lower())
+        metrics.view_started = time.perf_counter()
+        return None
+
+    def log(self, request, response, metrics, total):
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "view": metrics.view,
+            "action": metrics.action,
+            "duration_ms": round(total * 1000, 1),
+            "view_ms": round(metrics.timings["view"] * 1000, 1),
+            "serializer_ms": round(metrics.timings["serializer"] * 1000, 1),
+            "db_ms": round(metrics.sql_time * 1000, 1),
+            "queries": metrics.queries,
+        }
+        level = logging.INFO
+        repeated = metrics.get_repeated_statements(self.repeated_threshold)
+        if repeated:
+            record["repeated_queries"] = repeated
+            level = logging.WARNING
+        if self.sampler.is_slow(total):
+            record["sql"] = [
+                {
+                    "sql": sql[:SQL_SAMPLE_LENGTH],
+                    "ms": round(elapsed * 1000, 2),
+                }
+                for sql, elapsed in metrics.sql
+            ]
+            level = logging.WARNING
+        logger.log(level, json.dumps(record, ensure_ascii=False))
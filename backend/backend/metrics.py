@@ -0,0 +1,90 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from django.http import HttpResponse
+
+REQUEST_LATENCY = Histogram(
+    "foodgram_request_duration_seconds",
+    "Время обработки запроса.",
+    ("view", "action", "method"),
+)
+REQUEST_QUERIES = Histogram(
+    "foodgram_request_queries",
+    "Число SQL-запросов на запрос к API.",
+    ("view", "action", "method"),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float("inf")),
+)
+CACHE_REQUESTS = Counter(
+    "foodgram_cache_requests",
+    "Обращения к кэшам по результату: hit или miss.",
+    ("cache", "result"),
+)
+SHOPPING_CART_EXPORT_BYTES = Histogram(
+    "foodgram_shopping_cart_export_bytes",
+    "Размер выгруженного списка покупок.",
+    ("format",),
+    buckets=(512, 2048, 8192, 32768, 131072, 524288, float("inf")),
+)
+RECIPE_IMAGE_UPLOAD_BYTES = Histogram(
+    "foodgram_recipe_image_upload_bytes",
+    "Размер загруженных изображений рецептов.",
+    buckets=(
+        16384,
+        65536,
+        262144,
+        1048576,
+        4194304,
+        16777216,
+        float("inf"),
+    ),
+)
+
+
+def observe_request(view, action, method, duration, queries):
+    labels = (view or "", action or "", method)
+    REQUEST_LATENCY.labels(*labels).observe(duration)
+    REQUEST_QUERIES.labels(*labels).observe(queries)
+
+
+def record_cache(name, hits, misses):
+    if hits:
+        CACHE_REQUESTS.labels(name, "hit").inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(name, "miss").inc(misses)
+
+
+def count_export_bytes(chunks, export_format):
+    """Pass the chunks through and record the export size at the end."""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    SHOPPING_CART_EXPORT_BYTES.labels(export_format).observe(size)
+
+
+def get_registry():
+    """Collect from every worker's files in multiprocess mode.
+
+    Gunicorn workers write their samples to ``PROMETHEUS_MULTIPROC_DIR``
+    (see ``gunicorn.conf.py``), so any worker can answer for all.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     # 3rd party apps
     "rest_framework",
     "rest_framework.authtoken",
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "backend.instrumentation.RequestMetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -91,6 +93,21 @@ DATABASES = {
     }
 }
 
+# Version stamps and cached recipe fragments are shared between all
+# workers and containers, so production needs a shared cache such as
+# memcached. The per-process default is only fit for development and
+# tests with a single worker.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", default=""),
+        "TIMEOUT": int(os.getenv("CACHE_TIMEOUT", default=300)),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -122,6 +139,32 @@ STATIC_ROOT = os.path.join(BASE_DIR, "django_static")
 MEDIA_URL = "/django_media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "django_media")
 
+IMAGE_RENDITION_WORKERS = int(os.getenv("IMAGE_RENDITION_WORKERS", default=2))
+
+# Serve ingredient search from an in-memory index instead of the
+# database. Every worker process builds its own copy on first search,
+# about 1 KB per ingredient.
+INGREDIENT_SEARCH_INDEX = (
+    os.getenv("INGREDIENT_SEARCH_INDEX", default="1") == "1"
+)
+
+REQUEST_METRICS_SLOW_PERCENT = float(
+    os.getenv("REQUEST_METRICS_SLOW_PERCENT", default=1)
+)
+REQUEST_METRICS_REPEATED_QUERIES = int(
+    os.getenv("REQUEST_METRICS_REPEATED_QUERIES", default=5)
+)
+# Server-Timing exposes query counts and timings to every client, so
+# it is meant for development and staging.
+REQUEST_METRICS_SERVER_TIMING = (
+    os.getenv("REQUEST_METRICS_SERVER_TIMING", default="0") == "1"
+)
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    "PDF_FONT_PATH",
+    default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
@@ -144,6 +187,23 @@ SILENCED_SYSTEM_CHECKS = ("rest_framework.W001",)
 
 USE_X_FORWARDED_HOST = True
 
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # Every request is logged at INFO, slow requests and likely N+1
+        # queries at WARNING.
+        "backend.instrumentation": {
+            "handlers": ["console"],
+            "level": os.getenv("REQUEST_METRICS_LOG_LEVEL", default="WARNING"),
+            "propagate": False,
+        },
+    },
+}
+
 DEBUG_TOOLBAR_CONFIG = {
     "SHOW_TOOLBAR_CALLBACK": lambda request: DEBUG,
 }
@@ -0,0 +1,26 @@
+from rest_framework.test import APITestCase
+
+from django.test import override_settings
+
+from recipes.models import Tag
+
+
+class RequestMetricsMiddlewareTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name="Обед", color="#49B64E", slug="lunch")
+
+    def test_server_timing_is_off_by_default(self):
+        response = self.client.get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(REQUEST_METRICS_SERVER_TIMING=True)
+    def test_server_timing_lists_metrics(self):
+        response = self.client.get("/api/recipes/")
+        self.assertEqual(response.status_code, 200)
+        timings = dict(
+            metric.strip().split(";")[:2]
+            for metric in response["Server-Timing"].split(",")
+        )
+        self.assertEqual(set(timings), {"db", "view", "serializer", "total"})
@@ -7,6 +7,7 @@ from django.urls import include, path
 
 from recipes.urls import router as recipe_router
 from users.urls import router as user_router
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.registry.extend(user_router.registry)
@@ -25,6 +26,7 @@ api_urls = [
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(api_urls)),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 if settings.DEBUG:
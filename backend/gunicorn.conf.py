@@ -0,0 +1,19 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+bind = "0:8000"
+
+
+def on_starting(server):
+    """Start from an empty metrics directory, dropping stale samples."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -21,14 +21,14 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("name", "author", "pub_date")
+    list_display = ("name", "author", "pub_date", "favorites_count")
     list_display_links = ("name",)
     search_fields = ("name",)
     list_filter = ("name", "author", "tags")
     ordering = ("-pub_date",)
     exclude = ("tags",)
     inlines = (IngredientInRecipeInline, TagInline)
-    readonly_fields = ("get_count", "pub_date")
+    readonly_fields = ("favorites_count", "in_carts_count", "pub_date")
     fieldsets = (
         (
             None,
@@ -40,16 +40,13 @@ class RecipeAdmin(admin.ModelAdmin):
                     "cooking_time",
                     "image",
                     "pub_date",
-                    "get_count",
+                    "favorites_count",
+                    "in_carts_count",
                 )
             },
         ),
     )
 
-    @admin.display(description="Добавили в избранное")
-    def get_count(self, recipe):
-        return recipe.in_favorites.count()
-
 
 class TagAdmin(admin.ModelAdmin):
     list_display = ("name", "slug")
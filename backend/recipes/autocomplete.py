@@ -0,0 +1,150 @@
+import struct
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from django.db import connection
+
+from backend.metrics import record_cache
+from .models import Ingredient
+from .versions import INGREDIENTS_VERSION_KEY, get_version
+
+PREFIX_END = "\U0010ffff"
+
+
+def as_float4(value):
+    """Round like PostgreSQL's real, which pg_trgm uses for similarity."""
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def get_trigrams(value):
+    """Mirror pg_trgm: lower-cased alphanumeric words padded with blanks."""
+    trigrams = set()
+    word = []
+    for char in value.lower() + " ":
+        if char.isalnum():
+            word.append(char)
+            continue
+        if word:
+            padded = "  " + "".join(word) + " "
+            trigrams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+            word = []
+    return trigrams
+
+
+class IngredientIndex:
+    """Sorted in-memory copy of the ingredient catalogue.
+
+    Rows keep their position in the database ordering by name, so
+    results are ordered exactly like ``IngredientSearchFilter``, which
+    serves searches when ``INGREDIENT_SEARCH_INDEX`` is off.
+    """
+
+    def __init__(self, version, rows, fuzzy):
+        self.version = version
+        self.fuzzy = fuzzy
+        self.rows = [
+            {"id": pk, "name": name, "measurement_unit": unit}
+            for pk, name, unit in rows
+        ]
+        folded = sorted(
+            (row["name"].casefold(), position)
+            for position, row in enumerate(self.rows)
+        )
+        self.keys = [key for key, _ in folded]
+        self.positions = [position for _, position in folded]
+        # Folded names in database order, so substring scans yield
+        # matches already sorted and can stop at the limit.
+        names = [row["name"].casefold() for row in self.rows]
+        self.haystack = "\n".join(names)
+        self.ends = []
+        offset = 0
+        for name in names:
+            offset += len(name)
+            self.ends.append(offset)
+            offset += 1
+        self.trigram_counts = []
+        self.postings = {}
+        if fuzzy:
+            for position, row in enumerate(self.rows):
+                trigrams = get_trigrams(row["name"])
+                self.trigram_counts.append(len(trigrams))
+                for trigram in trigrams:
+                    self.postings.setdefault(trigram, []).append(position)
+
+    @classmethod
+    def build(cls, version):
+        rows = Ingredient.objects.order_by("name").values_list(
+            "id", "name", "measurement_unit"
+        )
+        return cls(version, list(rows), connection.vendor == "postgresql")
+
+    def search(self, term, limit, similarity_threshold):
+        folded = term.casefold()
+        start = bisect_left(self.keys, folded)
+        end = bisect_left(self.keys, folded + PREFIX_END, lo=start)
+        positions = sorted(self.positions[start:end])[:limit]
+        found = set(positions)
+        if len(positions) < limit:
+            positions += self.find_substrings(
+                folded, limit - len(positions), found
+            )
+        if self.fuzzy and len(positions) < limit:
+            found.update(positions)
+            positions += self.search_fuzzy(
+                term, limit - len(positions), similarity_threshold, found
+            )
+        return [self.rows[position] for position in positions]
+
+    def find_substrings(self, folded, limit, exclude):
+        matches = []
+        start = self.haystack.find(folded)
+        while start != -1 and len(matches) < limit:
+            position = bisect_left(self.ends, start + len(folded))
+            if position not in exclude:
+                matches.append(position)
+            start = self.haystack.find(folded, self.ends[position] + 1)
+        return matches
+
+    def search_fuzzy(self, term, limit, similarity_threshold, exclude):
+        trigrams = get_trigrams(term)
+        common = Counter(
+            position
+            for trigram in trigrams
+            for position in self.postings.get(trigram, ())
+        )
+        scored = []
+        for position, shared in common.items():
+            if position in exclude:
+                continue
+            similarity = as_float4(
+                shared
+                / (len(trigrams) + self.trigram_counts[position] - shared)
+            )
+            if similarity >= similarity_threshold:
+                scored.append((-similarity, position))
+        return [position for _, position in sorted(scored)[:limit]]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    """Return the worker's index, rebuilding it when the version changes.
+
+    The index lives in process memory, so each gunicorn or uvicorn
+    worker builds and keeps its own copy, about 1 KB per ingredient
+    with the trigram postings used on PostgreSQL.
+    """
+    global _index
+    version = get_version(INGREDIENTS_VERSION_KEY)
+    index = _index
+    fresh = index is not None and index.version == version
+    record_cache("ingredient_index", fresh, not fresh)
+    if not fresh:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = IngredientIndex.build(version)
+            index = _index
+    return index
@@ -0,0 +1,56 @@
+import time
+import tracemalloc
+
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def fetch(client, url):
+    """GET the url and read the whole body, streamed or not."""
+    response = client.get(url)
+    if response.streaming:
+        content = b"".join(response.streaming_content)
+    else:
+        content = response.content
+    return response, content
+
+
+def measure(client, url, runs, warmup=0):
+    """Time ``runs`` requests to the url after ``warmup`` untimed ones.
+
+    Queries are counted on the timed runs. Peak memory is traced on one
+    extra run, since tracemalloc slows everything down.
+    """
+    for _ in range(warmup):
+        fetch(client, url)
+    timings = []
+    query_counts = []
+    for _ in range(runs):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response, content = fetch(client, url)
+            timings.append(time.perf_counter() - started)
+        query_counts.append(len(queries))
+    tracemalloc.start()
+    try:
+        fetch(client, url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "url": url,
+        "status": response.status_code,
+        "runs": runs,
+        "p50_ms": round(percentile(timings, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 2),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 2),
+        "queries": max(query_counts),
+        "bytes": len(content),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
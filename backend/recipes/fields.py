@@ -0,0 +1,162 @@
+from operator import attrgetter
+
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Manager
+
+from .images import build_absolute_urls, get_rendition_urls
+
+
+class BulkRelatedFieldMixin:
+    """Related field that can look many values up with one query.
+
+    ``prefetch()`` resolves a batch of values with a single ``in_bulk``;
+    ``to_internal_value`` then reads from that batch instead of running
+    a query per value, and fails with the field's usual messages.
+    Values are looked up by ``lookup_field``.
+    """
+
+    lookup_field = "pk"
+    resolved = None
+
+    def get_key(self, data):
+        opts = self.get_queryset().model._meta
+        field = (
+            opts.pk
+            if self.lookup_field == "pk"
+            else opts.get_field(self.lookup_field)
+        )
+        return field.to_python(data)
+
+    def prefetch(self, values):
+        keys = set()
+        for value in values:
+            try:
+                keys.add(self.get_key(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                continue
+        keys.discard(None)
+        self.resolved = self.get_queryset().in_bulk(
+            keys, field_name=self.lookup_field
+        )
+
+    def to_internal_value(self, data):
+        if self.resolved is None:
+            return super().to_internal_value(data)
+        try:
+            key = self.get_key(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail_invalid(data)
+        if key not in self.resolved:
+            self.fail_missing(data)
+        return self.resolved[key]
+
+
+class BulkPrimaryKeyRelatedField(
+    BulkRelatedFieldMixin, serializers.PrimaryKeyRelatedField
+):
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {"child_relation": cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def get_key(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        return super().get_key(data)
+
+    def fail_invalid(self, data):
+        self.fail("incorrect_type", data_type=type(data).__name__)
+
+    def fail_missing(self, data):
+        self.fail("does_not_exist", pk_value=data)
+
+
+class BulkSlugRelatedField(
+    BulkRelatedFieldMixin, serializers.SlugRelatedField
+):
+    @property
+    def lookup_field(self):
+        return self.slug_field
+
+    def fail_invalid(self, data):
+        self.fail("invalid")
+
+    def fail_missing(self, data):
+        self.fail("does_not_exist", slug_name=self.slug_field, value=str(data))
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Resolve the whole list at once and report every bad value."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+        self.child_relation.prefetch(data)
+        values = []
+        errors = []
+        for item in data:
+            try:
+                values.append(self.child_relation.to_internal_value(item))
+            except serializers.ValidationError as error:
+                errors.extend(error.detail)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return values
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """List serializer that prefetches the bulk fields of all its items."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            items = [item for item in data if isinstance(item, dict)]
+            for name, field in self.child.fields.items():
+                if isinstance(field, BulkRelatedFieldMixin):
+                    field.prefetch(
+                        item[name] for item in items if name in item
+                    )
+        return super().to_internal_value(data)
+
+
+class OrderedListSerializer(serializers.ListSerializer):
+    """List serializer that lists related objects by primary key.
+
+    Prefetched relations come back in no particular order, while cached
+    recipe fragments list them by id, so both paths must sort the same.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        return super().to_representation(sorted(data, key=attrgetter("pk")))
+
+
+class RenditionsField(serializers.Field):
+    """Image renditions of a recipe with absolute URLs.
+
+    With ``size`` only that rendition is returned, or ``None`` while the
+    renditions are pending.
+    """
+
+    def __init__(self, size=None, **kwargs):
+        self.size = size
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        renditions = get_rendition_urls(recipe.renditions, recipe.image.name)
+        request = self.context.get("request")
+        if request is not None:
+            renditions = build_absolute_urls(request, renditions)
+        if self.size is None:
+            return renditions
+        return renditions.get(self.size)
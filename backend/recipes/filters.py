@@ -0,0 +1,53 @@
+from rest_framework.filters import BaseFilterBackend
+
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+
+
+class IngredientSearchFilter(BaseFilterBackend):
+    """Rank prefix matches first, then substring and fuzzy matches.
+
+    Fuzzy matching relies on pg_trgm and is skipped on other databases.
+    """
+
+    search_param = "name"
+    max_results = 50
+    # Default of pg_trgm.similarity_threshold used by the % operator.
+    similarity_threshold = 0.3
+
+    def get_search_term(self, request):
+        return request.query_params.get(self.search_param, "").strip()
+
+    def filter_queryset(self, request, queryset, view):
+        search_term = self.get_search_term(request)
+        if not search_term or view.action != "list":
+            return queryset
+
+        is_prefix = Q(name__istartswith=search_term)
+        is_substring = Q(name__icontains=search_term)
+        matches = is_prefix | is_substring
+        queryset = queryset.annotate(
+            rank=Case(
+                When(is_prefix, then=Value(0)),
+                When(is_substring, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            )
+        )
+        if connection.vendor == "postgresql":
+            from django.contrib.postgres.search import TrigramSimilarity
+
+            matches |= Q(name__trigram_similar=search_term)
+            similarity = TrigramSimilarity("name", search_term)
+        else:
+            similarity = Value(0.0)
+        queryset = queryset.annotate(
+            similarity=Case(
+                When(rank__lt=2, then=Value(1.0)),
+                default=similarity,
+                output_field=FloatField(),
+            )
+        )
+        return queryset.filter(matches).order_by(
+            "rank", "-similarity", "name"
+        )[: self.max_results]
@@ -0,0 +1,157 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from backend.metrics import record_cache
+from users.serializers import UserSerializer
+from .images import build_absolute_urls, get_rendition_urls
+from .models import IngredientInRecipe, Recipe
+from .serializers import (
+    IngrInRecipeSafeSerializer,
+    RecipeSafeSerializer,
+    TagSerializer,
+)
+from .versions import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY, get_version
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+FRAGMENT_VERSION_KEYS = (INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY)
+AUTHOR_FIELDS = tuple(
+    field
+    for field in UserSerializer.Meta.fields
+    if field not in ("is_subscribed", "password")
+)
+
+
+def get_fragment_key(recipe_id):
+    return f"fragments:recipe:{recipe_id}"
+
+
+def get_stamp(recipe, versions):
+    return (recipe.updated_at.isoformat(), *versions)
+
+
+def render_fragments(recipe_ids):
+    """Build fragments straight from ``values_list`` rows.
+
+    A fragment is a ``RecipeSafeSerializer`` item without the per-user
+    flags and with a relative image URL, built without model instances
+    or serializer fields. Tags and ingredient lines are listed by id,
+    as the serializer lists them.
+    """
+    tags = defaultdict(list)
+    tag_rows = (
+        Recipe.tags.through.objects.filter(recipe_id__in=recipe_ids)
+        .order_by("tag_id")
+        .values_list(
+            "recipe_id",
+            *(f"tag__{field}" for field in TagSerializer.Meta.fields),
+        )
+    )
+    for recipe_id, *values in tag_rows:
+        tags[recipe_id].append(dict(zip(TagSerializer.Meta.fields, values)))
+
+    ingredients = defaultdict(list)
+    ingredient_rows = (
+        IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .order_by("id")
+        .values_list(
+            "recipe_id",
+            "ingredient_id",
+            "ingredient__name",
+            "ingredient__measurement_unit",
+            "amount",
+        )
+    )
+    for recipe_id, *values in ingredient_rows:
+        ingredients[recipe_id].append(
+            dict(zip(IngrInRecipeSafeSerializer.Meta.fields, values))
+        )
+
+    storage = Recipe._meta.get_field("image").storage
+    recipe_rows = Recipe.objects.filter(pk__in=recipe_ids).values_list(
+        "id",
+        "name",
+        "image",
+        "renditions",
+        "text",
+        "cooking_time",
+        *(f"author__{field}" for field in AUTHOR_FIELDS),
+    )
+    fragments = {}
+    for row in recipe_rows:
+        recipe_id, name, image, renditions, text, cooking_time, *author = row
+        values = {
+            "id": recipe_id,
+            "tags": tags[recipe_id],
+            "author": {
+                **dict(zip(AUTHOR_FIELDS, author)),
+                "is_subscribed": False,
+            },
+            "ingredients": ingredients[recipe_id],
+            "is_favorited": False,
+            "is_in_shopping_cart": False,
+            "name": name,
+            "image": storage.url(image) if image else None,
+            "renditions": get_rendition_urls(renditions, image),
+            "text": text,
+            "cooking_time": cooking_time,
+        }
+        fragments[recipe_id] = {
+            field: values[field] for field in RecipeSafeSerializer.Meta.fields
+        }
+    return fragments
+
+
+def get_recipe_fragments(recipes, render):
+    """Return cached fragments of the recipes, rendering only the misses.
+
+    ``recipes`` need ``id`` and ``updated_at``. ``render`` takes the ids
+    of missing recipes and returns their fragments by id. Fragments and
+    version stamps come from a single cache round trip.
+    """
+    keys = {recipe.id: get_fragment_key(recipe.id) for recipe in recipes}
+    cached = cache.get_many((*FRAGMENT_VERSION_KEYS, *keys.values()))
+    versions = tuple(
+        cached.get(key) or get_version(key) for key in FRAGMENT_VERSION_KEYS
+    )
+    fragments = {}
+    stamps = {}
+    for recipe in recipes:
+        stamps[recipe.id] = get_stamp(recipe, versions)
+        entry = cached.get(keys[recipe.id])
+        if entry is not None and entry[0] == stamps[recipe.id]:
+            fragments[recipe.id] = entry[1]
+    missing = [recipe_id for recipe_id in keys if recipe_id not in fragments]
+    record_cache("recipe_fragments", len(fragments), len(missing))
+    if missing:
+        rendered = render(missing)
+        cache.set_many(
+            {
+                keys[recipe_id]: (stamps[recipe_id], fragment)
+                for recipe_id, fragment in rendered.items()
+            },
+            timeout=FRAGMENT_TIMEOUT,
+        )
+        fragments.update(rendered)
+    return fragments
+
+
+def apply_user_flags(request, fragment, recipe):
+    """Fill a fragment in with the flags annotated on ``recipe``."""
+    data = dict(fragment)
+    data["author"] = {
+        **fragment["author"],
+        "is_subscribed": getattr(recipe, "is_subscribed", False),
+    }
+    data["is_favorited"] = getattr(recipe, "is_favorited", False)
+    data["is_in_shopping_cart"] = getattr(recipe, "is_in_shopping_cart", False)
+    if data["image"]:
+        data["image"] = request.build_absolute_uri(data["image"])
+    data["renditions"] = build_absolute_urls(request, fragment["renditions"])
+    return data
+
+
+def drop_recipe_fragments(recipe_ids):
+    cache.delete_many(
+        [get_fragment_key(recipe_id) for recipe_id in recipe_ids]
+    )
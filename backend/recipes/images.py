@@ -0,0 +1,161 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = "recipes/renditions"
+RENDITION_SIZES = {
+    "thumbnail": (320, 320),
+    "card": (640, 640),
+    "full": (1280, 1280),
+}
+RENDITION_FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 85, "optimize": True}),
+}
+
+
+def get_storage():
+    return Recipe._meta.get_field("image").storage
+
+
+def flatten(image):
+    """Drop transparency onto white, JPEG has no alpha channel."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def make_renditions(name):
+    """Resize the stored image and save every size in every format."""
+    storage = get_storage()
+    stem = PurePosixPath(name).stem
+    sizes = {}
+    with storage.open(name) as file, Image.open(file) as source:
+        original = flatten(source)
+        for size, box in RENDITION_SIZES.items():
+            image = original.copy()
+            image.thumbnail(box)
+            rendition = {"width": image.width, "height": image.height}
+            for key, (
+                image_format,
+                suffix,
+                options,
+            ) in RENDITION_FORMATS.items():
+                buffer = io.BytesIO()
+                image.save(buffer, image_format, **options)
+                rendition[key] = storage.save(
+                    f"{RENDITIONS_DIR}/{stem}-{size}.{suffix}",
+                    ContentFile(buffer.getvalue()),
+                )
+            sizes[size] = rendition
+    return {"source": name, "sizes": sizes}
+
+
+def delete_renditions(renditions):
+    storage = get_storage()
+    for rendition in renditions.get("sizes", {}).values():
+        for key in RENDITION_FORMATS:
+            storage.delete(rendition[key])
+
+
+def process_recipe_image(recipe_id, name):
+    """Build the renditions and attach them if the image is still current.
+
+    Bumps ``updated_at``, so cached representations are rebuilt. Files
+    of the renditions being replaced are deleted.
+    """
+    try:
+        renditions = make_renditions(name)
+        recipes = Recipe.objects.filter(pk=recipe_id, image=name)
+        previous = recipes.values_list("renditions", flat=True).first()
+        updated = recipes.update(
+            renditions=renditions, updated_at=timezone.now()
+        )
+        delete_renditions(previous if updated else renditions)
+        return bool(updated)
+    except Exception:
+        logger.exception(
+            "Не удалось обработать изображение %s рецепта %s", name, recipe_id
+        )
+        return False
+    finally:
+        connection.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_RENDITION_WORKERS,
+                    thread_name_prefix="renditions",
+                )
+    return _executor
+
+
+def schedule_renditions(recipe):
+    """Render the image in the worker pool once the upload is committed."""
+    recipe_id, name = recipe.id, recipe.image.name
+    transaction.on_commit(
+        lambda: get_executor().submit(process_recipe_image, recipe_id, name)
+    )
+
+
+def needs_renditions(recipe):
+    return bool(recipe.image) and (
+        recipe.renditions.get("source") != recipe.image.name
+    )
+
+
+def get_rendition_urls(renditions, image_name):
+    """Rendition sizes with storage URLs, empty while they are pending."""
+    if not image_name or renditions.get("source") != image_name:
+        return {}
+    storage = get_storage()
+    sizes = renditions["sizes"]
+    return {
+        size: {
+            "width": sizes[size]["width"],
+            "height": sizes[size]["height"],
+            **{
+                key: storage.url(sizes[size][key]) for key in RENDITION_FORMATS
+            },
+        }
+        for size in RENDITION_SIZES
+        if size in sizes
+    }
+
+
+def build_absolute_urls(request, renditions):
+    return {
+        size: {
+            **rendition,
+            **{
+                key: request.build_absolute_uri(rendition[key])
+                for key in RENDITION_FORMATS
+            },
+        }
+        for size, rendition in renditions.items()
+    }
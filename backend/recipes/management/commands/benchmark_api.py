@@ -0,0 +1,165 @@
+import json
+import subprocess
+from pathlib import Path
+from urllib.parse import quote
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from recipes.benchmarks import measure
+from recipes.models import CartItem, Favorite, IngredientInRecipe, Recipe, Tag
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ("git", "rev-parse", "--short", "HEAD"),
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет основные запросы API через тестовый клиент и сохраняет "
+        "p50/p95, число SQL-запросов и пик памяти в JSON-отчёт. Данные "
+        "для замера создаёт seed_perf."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            default="perf-0@example.com",
+            help="Email пользователя, от имени которого идут запросы.",
+        )
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--output", default="benchmark_report.json")
+        parser.add_argument(
+            "--compare",
+            help="Отчёт прошлого замера, с которым сравнить результаты.",
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options["user"]).first()
+        if user is None:
+            raise CommandError(
+                f"Нет пользователя {options['user']}, запустите seed_perf."
+            )
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        results = {}
+        for name, url in self.get_scenarios(user):
+            result = measure(client, url, options["runs"], options["warmup"])
+            if result["status"] != 200:
+                raise CommandError(f"{url}: HTTP {result['status']}")
+            results[name] = result
+            self.stdout.write(
+                f"{name:<26} p50={result['p50_ms']:8.1f} мс  "
+                f"p95={result['p95_ms']:8.1f} мс  "
+                f"запросов={result['queries']:<3} "
+                f"память={result['peak_memory_kb']:8.1f} КБ"
+            )
+
+        report = {
+            "commit": get_commit(),
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "dataset": self.get_dataset(),
+            "scenarios": results,
+        }
+        Path(options["output"]).write_text(
+            json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Отчёт сохранён в {options['output']}.")
+        )
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def get_scenarios(self, user):
+        tags = list(Tag.objects.order_by("id").values_list("slug", flat=True))
+        author_id = (
+            Subscription.objects.filter(subscriber=user)
+            .values_list("subscribed_id", flat=True)
+            .first()
+        )
+        recipe_id = Recipe.objects.values_list("id", flat=True).first()
+        ingredient = (
+            IngredientInRecipe.objects.filter(recipe__in_baskets=user)
+            .values_list("ingredient__name", flat=True)
+            .first()
+        )
+        scenarios = [
+            ("recipes", "/api/recipes/?limit=6"),
+            (
+                "recipes_tags",
+                "/api/recipes/?limit=6&"
+                + "&".join(f"tags={slug}" for slug in tags[:2]),
+            ),
+            ("recipes_favorited", "/api/recipes/?limit=6&is_favorited=1"),
+            (
+                "recipes_in_shopping_cart",
+                "/api/recipes/?limit=6&is_in_shopping_cart=1",
+            ),
+            ("recipes_page_100", "/api/recipes/?limit=6&page=100"),
+            ("subscriptions", "/api/users/subscriptions/?recipes_limit=3"),
+            ("download_shopping_cart", "/api/recipes/download_shopping_cart/"),
+            (
+                "download_shopping_cart_pdf",
+                "/api/recipes/download_shopping_cart/?file_format=pdf",
+            ),
+        ]
+        if author_id is not None:
+            scenarios.append(
+                ("recipes_author", f"/api/recipes/?limit=6&author={author_id}")
+            )
+        if recipe_id is not None:
+            scenarios.append(("recipe_detail", f"/api/recipes/{recipe_id}/"))
+        if ingredient:
+            scenarios.append(
+                (
+                    "ingredients_search",
+                    f"/api/ingredients/?name={quote(ingredient[:3])}",
+                )
+            )
+        return scenarios
+
+    def get_dataset(self):
+        return {
+            "users": User.objects.count(),
+            "recipes": Recipe.objects.count(),
+            "ingredient_lines": IngredientInRecipe.objects.count(),
+            "favorites": Favorite.objects.count(),
+            "cart_items": CartItem.objects.count(),
+            "subscriptions": Subscription.objects.count(),
+        }
+
+    def compare(self, path, results):
+        baseline = json.loads(Path(path).read_text(encoding="utf-8"))
+        self.stdout.write(f"Сравнение с {baseline.get('commit') or path}:")
+        for name, result in results.items():
+            old = baseline["scenarios"].get(name)
+            if old is None:
+                continue
+            ratio = result["p50_ms"] / old["p50_ms"] if old["p50_ms"] else 0
+            self.stdout.write(
+                f"{name:<26} p50 {old['p50_ms']:8.1f} → "
+                f"{result['p50_ms']:8.1f} мс ({ratio:.2f}x)  "
+                f"запросов {old['queries']} → {result['queries']}"
+            )
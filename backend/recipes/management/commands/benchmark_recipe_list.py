@@ -0,0 +1,152 @@
+import random
+
+from rest_framework.test import APIClient
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.benchmarks import measure
+from recipes.models import CartItem, Favorite, Recipe, Tag
+
+User = get_user_model()
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_TAGS = (
+    ("Бенчмарк завтрак", "#FFFF00", "bench-breakfast"),
+    ("Бенчмарк обед", "#FF0000", "bench-lunch"),
+    ("Бенчмарк ужин", "#0000FF", "bench-dinner"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время ответа списка рецептов с фильтрами. С --seed "
+        "предварительно создаёт синтетические рецепты в текущей БД."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Сколько синтетических рецептов создать перед замером.",
+        )
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=6)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            self.seed(options["seed"], options["batch_size"])
+        user = User.objects.filter(email=BENCH_EMAIL).first()
+        if user is None:
+            raise CommandError("Нет данных для замера, запустите с --seed.")
+
+        client = APIClient()
+        client.force_authenticate(user)
+        limit = options["limit"]
+        scenarios = (
+            ("без фильтров", f"/api/recipes/?limit={limit}"),
+            (
+                "теги",
+                f"/api/recipes/?limit={limit}"
+                "&tags=bench-breakfast&tags=bench-lunch",
+            ),
+            ("избранное", f"/api/recipes/?limit={limit}&is_favorited=1"),
+            (
+                "корзина",
+                f"/api/recipes/?limit={limit}&is_in_shopping_cart=1",
+            ),
+            (
+                "избранное и тег",
+                f"/api/recipes/?limit={limit}&is_favorited=1"
+                "&tags=bench-dinner",
+            ),
+            ("страница 1000", f"/api/recipes/?limit={limit}&page=1000"),
+            (
+                "популярные",
+                f"/api/recipes/?limit={limit}&ordering=-favorites_count",
+            ),
+            (
+                "курсор",
+                f"/api/recipes/?limit={limit}&pagination=cursor"
+                "&tags=bench-breakfast",
+            ),
+        )
+        self.stdout.write(
+            f"Рецептов: {Recipe.objects.count()}, замеров: {options['runs']}"
+        )
+        for name, url in scenarios:
+            self.measure(client, name, url, options["runs"])
+
+    def measure(self, client, name, url, runs):
+        result = measure(client, url, runs)
+        if result["status"] != 200:
+            raise CommandError(f"{url}: HTTP {result['status']}")
+        self.stdout.write(
+            f"{name:<16} p50={result['p50_ms']:8.1f} мс  "
+            f"p95={result['p95_ms']:8.1f} мс  запросов={result['queries']}"
+        )
+
+    def seed(self, count, batch_size):
+        author, _ = User.objects.get_or_create(
+            email=BENCH_EMAIL,
+            defaults={"username": "bench", "first_name": "Bench"},
+        )
+        tags = [
+            Tag.objects.get_or_create(
+                slug=slug, defaults={"name": name, "color": color}
+            )[0]
+            for name, color, slug in BENCH_TAGS
+        ]
+        TagLink = Recipe.tags.through
+        created = 0
+        while created < count:
+            size = min(batch_size, count - created)
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=f"Рецепт {created + i}",
+                    text="Описание " * 20,
+                    cooking_time=random.randint(1, 120),
+                    image="bench.jpg",
+                )
+                for i in range(size)
+            )
+            if connection.features.can_return_rows_from_bulk_insert:
+                recipe_ids = [recipe.id for recipe in recipes]
+            else:
+                recipe_ids = list(
+                    Recipe.objects.order_by("-id").values_list(
+                        "id", flat=True
+                    )[:size]
+                )
+            TagLink.objects.bulk_create(
+                TagLink(recipe_id=recipe_id, tag_id=random.choice(tags).id)
+                for recipe_id in recipe_ids
+            )
+            favorite_ids = [
+                recipe_id for recipe_id in recipe_ids if random.random() < 0.01
+            ]
+            Favorite.objects.bulk_create(
+                Favorite(recipe_id=recipe_id, user_id=author.id)
+                for recipe_id in favorite_ids
+            )
+            Recipe.objects.filter(pk__in=favorite_ids).update(
+                favorites_count=1
+            )
+            cart_ids = [
+                recipe_id
+                for recipe_id in recipe_ids
+                if random.random() < 0.001
+            ]
+            CartItem.objects.bulk_create(
+                CartItem(recipe_id=recipe_id, user_id=author.id)
+                for recipe_id in cart_ids
+            )
+            Recipe.objects.filter(pk__in=cart_ids).update(in_carts_count=1)
+            created += size
+            self.stdout.write(f"Создано рецептов: {created}")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
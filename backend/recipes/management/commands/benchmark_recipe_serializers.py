@@ -0,0 +1,135 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.fragments import apply_user_flags, render_fragments
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.serializers import RecipeSafeSerializer
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает RecipeSafeSerializer и сборку рецептов из values() "
+        "на синтетической странице. Данные создаются во временной "
+        "транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=100)
+        parser.add_argument("--ingredients", type=int, default=15)
+        parser.add_argument("--runs", type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                recipe_ids = self.seed(
+                    options["recipes"], options["ingredients"]
+                )
+                self.compare(recipe_ids, options["runs"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, recipe_count, ingredient_count):
+        author = User.objects.create(
+            email="serializer-bench@example.com",
+            username="serializer-bench",
+            first_name="Bench",
+            last_name="Bench",
+        )
+        tags = [
+            Tag.objects.create(
+                name=f"serializer-bench-{i}",
+                color=f"#ABCD{i:02X}",
+                slug=f"serializer-bench-{i}",
+            )
+            for i in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"serializer-bench-{i}", measurement_unit="г")
+            for i in range(ingredient_count)
+        )
+        if not all(ingredient.pk for ingredient in ingredients):
+            ingredients = list(
+                Ingredient.objects.filter(name__startswith="serializer-bench")
+            )
+        recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f"Рецепт {i}",
+                text="Описание " * 20,
+                cooking_time=i + 1,
+                image="bench.jpg",
+            )
+            for i in range(recipe_count)
+        ]
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, ingredient=ingredient, amount=j + 1
+            )
+            for recipe in recipes
+            for j, ingredient in enumerate(ingredients)
+        )
+        for recipe in recipes:
+            recipe.tags.set(tags[: 1 + recipe.id % len(tags)])
+        return [recipe.id for recipe in recipes]
+
+    def compare(self, recipe_ids, runs):
+        request = Request(APIRequestFactory().get("/api/recipes/"))
+        context = {"request": request}
+        renderer = JSONRenderer()
+
+        def serializer_path():
+            recipes = (
+                Recipe.objects.select_related("author")
+                .prefetch_related("ingredients_in_recipe__ingredient", "tags")
+                .filter(pk__in=recipe_ids)
+            )
+            data = RecipeSafeSerializer(
+                recipes, many=True, context=context
+            ).data
+            return renderer.render(data)
+
+        def values_path():
+            recipes = list(Recipe.objects.filter(pk__in=recipe_ids).only("id"))
+            fragments = render_fragments(recipe_ids)
+            return renderer.render(
+                [
+                    apply_user_flags(request, fragments[recipe.id], recipe)
+                    for recipe in recipes
+                ]
+            )
+
+        if serializer_path() != values_path():
+            raise CommandError("Ответы сериализатора и values() различаются.")
+        results = {}
+        for name, path in (
+            ("RecipeSafeSerializer", serializer_path),
+            ("values()", values_path),
+        ):
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                path()
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            results[name] = timings[len(timings) // 2] * 1000
+            self.stdout.write(f"{name:<22} p50={results[name]:8.1f} мс")
+        speedup = results["RecipeSafeSerializer"] / results["values()"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ответы совпадают побайтно, ускорение {speedup:.1f}x."
+            )
+        )
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт уменьшенные копии изображений рецептов, у которых их "
+        "ещё нет. С --all пересоздаёт копии для всех рецептов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="rebuild",
+            help="Пересоздать копии и для рецептов, где они уже есть.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=settings.IMAGE_RENDITION_WORKERS
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image="").order_by("id")
+        pending = [
+            (recipe_id, image)
+            for recipe_id, image, renditions in recipes.values_list(
+                "id", "image", "renditions"
+            ).iterator()
+            if options["rebuild"] or renditions.get("source") != image
+        ]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            results = list(
+                executor.map(lambda args: process_recipe_image(*args), pending)
+            )
+        elapsed = time.perf_counter() - started
+        done = sum(results)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Обработано изображений: {done} из {len(pending)} "
+                f"за {elapsed:.2f} с."
+            )
+        )
+        if done < len(pending):
+            self.stderr.write(
+                f"Не удалось обработать: {len(pending) - done}, "
+                "подробности в журнале."
+            )
@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS_VERSION_KEY, bump_version
+
+JSON_READ_SIZE = 64 * 1024
+
+
+def iter_json_array(file):
+    """Yield the objects of a top-level JSON array without loading it all."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(JSON_READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != "[":
+                    raise CommandError("Ожидался JSON-массив объектов.")
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+        if not chunk:
+            raise CommandError("Неожиданный конец JSON-файла.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает ингредиенты из CSV или JSON. Существующие ингредиенты "
+        "с тем же названием обновляются, повторный запуск ничего не меняет."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу CSV или JSON.")
+        parser.add_argument(
+            "--format",
+            choices=("csv", "json"),
+            dest="file_format",
+            help="Формат файла, по умолчанию определяется по расширению.",
+        )
+        parser.add_argument("--encoding", default="utf-8")
+        parser.add_argument("--delimiter", default=",")
+        parser.add_argument(
+            "--skip-header",
+            action="store_true",
+            help="Пропустить первую строку CSV.",
+        )
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        file_format = options["file_format"] or path.suffix.lstrip(".")
+        if file_format not in ("csv", "json"):
+            raise CommandError("Укажите формат файла через --format.")
+
+        started = time.perf_counter()
+        try:
+            with path.open(encoding=options["encoding"], newline="") as file:
+                if file_format == "csv":
+                    rows = self.read_csv(file, options)
+                else:
+                    rows = self.read_json(file)
+                total, created, updated = self.load(
+                    rows, options["batch_size"]
+                )
+        except UnicodeDecodeError as error:
+            raise CommandError(
+                f"Файл не читается в кодировке {options['encoding']}: "
+                f"{error}. Укажите кодировку через --encoding, например "
+                "--encoding cp1251, а для CSV и разделитель --delimiter."
+            )
+        except csv.Error as error:
+            raise CommandError(
+                f"Ошибка разбора CSV: {error}. Проверьте --encoding "
+                "и разделитель --delimiter."
+            )
+        bump_version(INGREDIENTS_VERSION_KEY)
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Прочитано строк: {total}, добавлено: {created}, "
+                f"обновлено: {updated} за {elapsed:.2f} с "
+                f"({rate:.0f} строк/с)."
+            )
+        )
+
+    def read_csv(self, file, options):
+        reader = csv.reader(file, delimiter=options["delimiter"])
+        if options["skip_header"]:
+            next(reader, None)
+        for row in reader:
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+    def read_json(self, file):
+        for item in iter_json_array(file):
+            yield item.get("name", ""), item.get("measurement_unit", "")
+
+    def load(self, rows, batch_size):
+        rows = (
+            (name.strip(), unit.strip())
+            for name, unit in rows
+            if name and name.strip()
+        )
+        if connection.vendor == "postgresql":
+            return self.load_with_copy(rows, batch_size)
+        return self.load_with_orm(rows, batch_size)
+
+    @transaction.atomic()
+    def load_with_copy(self, rows, batch_size):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE ingredient_staging ("
+                "position bigserial, name varchar(200), "
+                "measurement_unit varchar(200)) ON COMMIT DROP"
+            )
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                total += len(batch)
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    "COPY ingredient_staging (name, measurement_unit) "
+                    "FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT DISTINCT ON (name) name, measurement_unit "
+                "FROM ingredient_staging ORDER BY name, position DESC "
+                "ON CONFLICT (name) DO UPDATE "
+                "SET measurement_unit = EXCLUDED.measurement_unit "
+                f"WHERE {table}.measurement_unit "
+                "IS DISTINCT FROM EXCLUDED.measurement_unit "
+                "RETURNING xmax = 0"
+            )
+            results = [inserted for inserted, in cursor.fetchall()]
+            # ON COMMIT DROP does not fire inside an outer transaction.
+            cursor.execute("DROP TABLE ingredient_staging")
+        created = sum(results)
+        return total, created, len(results) - created
+
+    @transaction.atomic()
+    def load_with_orm(self, rows, batch_size):
+        total = created = updated = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            total += len(batch)
+            units = dict(batch)
+            existing = Ingredient.objects.in_bulk(
+                units.keys(), field_name="name"
+            )
+            changed = []
+            for name, ingredient in existing.items():
+                if ingredient.measurement_unit != units[name]:
+                    ingredient.measurement_unit = units[name]
+                    changed.append(ingredient)
+            Ingredient.objects.bulk_update(
+                changed, ("measurement_unit",), batch_size=1000
+            )
+            new = [
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in units.items()
+                if name not in existing
+            ]
+            Ingredient.objects.bulk_create(new, batch_size=1000)
+            created += len(new)
+            updated += len(changed)
+        return total, created, updated
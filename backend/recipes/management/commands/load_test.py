@@ -0,0 +1,219 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from rest_framework.authtoken.models import Token
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.benchmarks import percentile
+
+User = get_user_model()
+
+DEFAULT_PATHS = (
+    "/api/recipes/?limit=6",
+    "/api/tags/",
+    "/api/ingredients/?name=%D0%BC%D1%83",
+    "/api/recipes/download_shopping_cart/",
+)
+CHUNK_SIZE = 64
+
+
+def get_rss_kb(pid):
+    """Resident memory of the process and all of its descendants."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            status = Path(f"/proc/{current}/status").read_text()
+            tasks = Path(f"/proc/{current}/task").iterdir()
+            for task in tasks:
+                children = (task / "children").read_text().split()
+                pending.extend(int(child) for child in children)
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                total += int(line.split()[1])
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагружает запущенный сервер параллельными GET-запросами и "
+        "выводит пропускную способность и задержки. Медленные клиенты "
+        "отправляют запросы и читают ответы с ограниченной скоростью и "
+        "держат соединения, как мобильные клиенты на плохой связи."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Путь запроса, можно указать несколько раз.",
+        )
+        parser.add_argument(
+            "--user",
+            default="perf-0@example.com",
+            help="Email пользователя, от имени которого идут запросы.",
+        )
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--duration", type=float, default=20, help="Секунд."
+        )
+        parser.add_argument("--slow-clients", type=int, default=0)
+        parser.add_argument(
+            "--slow-rate",
+            type=int,
+            default=256,
+            help="Скорость отправки и чтения медленного клиента, байт/с.",
+        )
+        parser.add_argument(
+            "--server-pid",
+            type=int,
+            help="PID мастер-процесса сервера для замера памяти.",
+        )
+        parser.add_argument("--output", help="Файл для JSON-отчёта.")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options["user"]).first()
+        if user is None:
+            raise CommandError(
+                f"Нет пользователя {options['user']}, запустите seed_perf."
+            )
+        token, _ = Token.objects.get_or_create(user=user)
+        url = urlsplit(options["base_url"])
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.token = token.key
+        self.paths = options["paths"] or DEFAULT_PATHS
+        self.slow_rate = options["slow_rate"]
+        self.server_pid = options["server_pid"]
+
+        report = asyncio.run(
+            self.run(
+                options["concurrency"],
+                options["slow_clients"],
+                options["duration"],
+            )
+        )
+        self.stdout.write(
+            f"Запросов: {report['requests']} за {report['duration_s']} с, "
+            f"{report['rps']} в секунду\n"
+            f"p50={report['p50_ms']} мс  p95={report['p95_ms']} мс  "
+            f"p99={report['p99_ms']} мс\n"
+            f"Ответы: {report['statuses']}, ошибок: {report['errors']}, "
+            f"медленных ответов: {report['slow_responses']}"
+        )
+        if report["server_rss_mb"] is not None:
+            self.stdout.write(
+                f"Память сервера (пик): {report['server_rss_mb']} МБ"
+            )
+        if options["output"]:
+            Path(options["output"]).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2),
+                encoding="utf-8",
+            )
+
+    async def run(self, concurrency, slow_clients, duration):
+        self.deadline = time.perf_counter() + duration
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.slow_responses = 0
+        self.peak_rss = None
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(self.client(i, slow=False) for i in range(concurrency)),
+            *(self.client(i, slow=True) for i in range(slow_clients)),
+            self.watch_memory(),
+        )
+        elapsed = time.perf_counter() - started
+        latencies = self.latencies or [0]
+        return {
+            "concurrency": concurrency,
+            "slow_clients": slow_clients,
+            "paths": list(self.paths),
+            "duration_s": round(elapsed, 1),
+            "requests": len(self.latencies),
+            "rps": round(len(self.latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "statuses": dict(self.statuses),
+            "errors": self.errors,
+            "slow_responses": self.slow_responses,
+            "server_rss_mb": (
+                round(self.peak_rss / 1024, 1)
+                if self.peak_rss is not None
+                else None
+            ),
+        }
+
+    async def client(self, number, slow):
+        position = number
+        while time.perf_counter() < self.deadline:
+            path = self.paths[position % len(self.paths)]
+            position += 1
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(
+                    self.fetch(path, slow), self.deadline - started
+                )
+            except asyncio.TimeoutError:
+                return
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                self.errors += 1
+                await asyncio.sleep(0.05)
+                continue
+            if slow:
+                self.slow_responses += 1
+                continue
+            self.statuses[status] += 1
+            self.latencies.append(time.perf_counter() - started)
+
+    async def fetch(self, path, slow):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            request = (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                f"Authorization: Token {self.token}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            if slow:
+                await self.trickle(writer, request)
+            else:
+                writer.write(request)
+                await writer.drain()
+            status_line = await reader.readline()
+            status = int(status_line.split()[1])
+            if not slow:
+                await reader.read()
+                return status
+            while await reader.read(CHUNK_SIZE):
+                await asyncio.sleep(CHUNK_SIZE / self.slow_rate)
+            return status
+        finally:
+            writer.close()
+
+    async def trickle(self, writer, data):
+        for start in range(0, len(data), CHUNK_SIZE):
+            writer.write(data[start : start + CHUNK_SIZE])
+            await writer.drain()
+            await asyncio.sleep(CHUNK_SIZE / self.slow_rate)
+
+    async def watch_memory(self):
+        if self.server_pid is None:
+            return
+        while time.perf_counter() < self.deadline:
+            rss = get_rss_kb(self.server_pid)
+            self.peak_rss = max(self.peak_rss or 0, rss)
+            await asyncio.sleep(0.5)
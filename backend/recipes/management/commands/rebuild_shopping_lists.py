@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+from recipes.services import get_live_shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает материализованные списки покупок из корзин "
+        "или сверяет их с актуальными данными (--verify)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сравнить списки покупок с корзинами.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Ограничиться пользователем с указанным id.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if options["verify"]:
+            self.verify(user_ids)
+        else:
+            self.rebuild(user_ids)
+
+    @transaction.atomic()
+    def rebuild(self, user_ids):
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        created = ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=amount
+                )
+                for user_id, ingredient_id, amount in get_live_shopping_lists(
+                    user_ids
+                ).iterator()
+            ),
+            batch_size=1000,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Записано позиций: {len(created)}.")
+        )
+
+    def verify(self, user_ids):
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        stored = set(
+            items.values_list("user_id", "ingredient_id", "amount").iterator()
+        )
+        live = set(get_live_shopping_lists(user_ids).iterator())
+        missing = live - stored
+        extra = stored - live
+        for user_id, ingredient_id, amount in sorted(missing):
+            self.stdout.write(
+                f"Отсутствует: user={user_id} "
+                f"ingredient={ingredient_id} amount={amount}"
+            )
+        for user_id, ingredient_id, amount in sorted(extra):
+            self.stdout.write(
+                f"Лишнее: user={user_id} "
+                f"ingredient={ingredient_id} amount={amount}"
+            )
+        if missing or extra:
+            raise CommandError(
+                "Списки покупок расходятся с корзинами. "
+                "Запустите команду без --verify."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Списки покупок совпадают с корзинами ({len(stored)})."
+            )
+        )
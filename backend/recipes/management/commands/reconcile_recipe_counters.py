@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from recipes.models import Recipe
+from recipes.services import CARTS, FAVORITES, count_links
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет счётчики избранного и корзин у рецептов с таблицами "
+        "связей и исправляет расхождения."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только показать расхождения, ничего не исправляя.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = list(self.get_drifted())
+            for recipe in drifted:
+                self.stdout.write(
+                    f"Рецепт {recipe.id}: избранное "
+                    f"{recipe.favorites_count} -> {recipe.live_favorites}, "
+                    f"корзины {recipe.in_carts_count} -> {recipe.live_carts}"
+                )
+            if options["verify"]:
+                self.verify(drifted)
+            else:
+                self.fix(drifted)
+
+    def verify(self, drifted):
+        if drifted:
+            raise CommandError(
+                f"Счётчики расходятся у рецептов: {len(drifted)}. "
+                "Запустите команду без --verify."
+            )
+        self.stdout.write(self.style.SUCCESS("Счётчики совпадают."))
+
+    def fix(self, drifted):
+        for recipe in drifted:
+            recipe.favorites_count = recipe.live_favorites
+            recipe.in_carts_count = recipe.live_carts
+        Recipe.objects.bulk_update(
+            drifted, ("favorites_count", "in_carts_count"), batch_size=1000
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Исправлено рецептов: {len(drifted)}.")
+        )
+
+    def get_drifted(self):
+        return (
+            Recipe.objects.select_for_update()
+            .annotate(
+                live_favorites=count_links(FAVORITES),
+                live_carts=count_links(CARTS),
+            )
+            .exclude(
+                favorites_count=F("live_favorites"),
+                in_carts_count=F("live_carts"),
+            )
+            .only("id", "favorites_count", "in_carts_count")
+            .order_by("id")
+        )
@@ -0,0 +1,277 @@
+import random
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import (
+    CartItem,
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    Tag,
+)
+from recipes.services import CARTS, FAVORITES, count_links
+from recipes.versions import INGREDIENTS_VERSION_KEY, bump_version
+from users.models import Subscription
+
+User = get_user_model()
+
+PERF_PREFIX = "perf"
+PERF_PASSWORD = "perf-password"
+PERF_TAGS = (
+    ("Завтрак", "#E26C2D"),
+    ("Обед", "#49B64E"),
+    ("Ужин", "#8775D2"),
+    ("Десерт", "#F4C430"),
+    ("Выпечка", "#C0392B"),
+    ("Суп", "#2980B9"),
+)
+INGREDIENT_WORDS = (
+    "мука",
+    "сахар",
+    "соль",
+    "молоко",
+    "масло",
+    "яйцо",
+    "морковь",
+    "картофель",
+    "лук",
+    "чеснок",
+    "говядина",
+    "курица",
+    "рис",
+    "гречка",
+    "сыр",
+    "томат",
+)
+UNITS = ("г", "кг", "мл", "л", "шт.", "ст. л.", "ч. л.", "по вкусу")
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт синтетический набор данных для замеров: пользователей, "
+        "рецепты, ингредиенты, избранное, корзины и подписки. Повторный "
+        "запуск добавляет ещё один такой же набор."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument(
+            "--authors",
+            type=float,
+            default=0.2,
+            help="Доля пользователей, публикующих рецепты.",
+        )
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument("--ingredients", type=int, default=2000)
+        parser.add_argument(
+            "--lines", type=int, default=8, help="Ингредиентов в рецепте."
+        )
+        parser.add_argument(
+            "--favorites", type=int, default=20, help="На пользователя."
+        )
+        parser.add_argument(
+            "--carts", type=int, default=5, help="На пользователя."
+        )
+        parser.add_argument(
+            "--subscriptions", type=int, default=10, help="На пользователя."
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--random-seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        for option in ("users", "recipes"):
+            if options[option] < 1:
+                raise CommandError(f"--{option} должно быть не меньше 1.")
+        self.random = random.Random(options["random_seed"])
+        self.batch_size = options["batch_size"]
+        started = time.perf_counter()
+        with transaction.atomic():
+            run = User.objects.filter(
+                username__startswith=f"{PERF_PREFIX}-"
+            ).count()
+            users = self.create_users(options["users"], run)
+            authors = users[: max(1, int(len(users) * options["authors"]))]
+            tags = self.create_tags()
+            ingredients = self.create_ingredients(options["ingredients"])
+            recipes = self.create_recipes(options["recipes"], authors, tags)
+            self.create_lines(recipes, ingredients, options["lines"])
+            self.create_links(Favorite, users, recipes, options["favorites"])
+            self.create_links(CartItem, users, recipes, options["carts"])
+            self.create_subscriptions(users, authors, options["subscriptions"])
+            Recipe.objects.filter(
+                pk__gte=recipes[0], pk__lte=recipes[-1]
+            ).update(
+                favorites_count=count_links(FAVORITES),
+                in_carts_count=count_links(CARTS),
+            )
+            for user_ids in batched(users, 500):
+                call_command(
+                    "rebuild_shopping_lists",
+                    user_ids=user_ids,
+                    stdout=self.stdout,
+                )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Набор создан за {time.perf_counter() - started:.1f} с. "
+                f"Пароль пользователей {PERF_PREFIX}-N@example.com: "
+                f"{PERF_PASSWORD}."
+            )
+        )
+
+    def bulk_create(self, label, model, objects):
+        """Insert in batches and return the new primary keys in order."""
+        ids = []
+        for batch in batched(objects, self.batch_size):
+            created = model.objects.bulk_create(batch)
+            if connection.features.can_return_rows_from_bulk_insert:
+                ids.extend(obj.pk for obj in created)
+            else:
+                ids.extend(
+                    reversed(
+                        model.objects.order_by("-pk").values_list(
+                            "pk", flat=True
+                        )[: len(batch)]
+                    )
+                )
+        self.stdout.write(f"{label}: {len(ids)}")
+        return ids
+
+    def create_users(self, count, run):
+        password = make_password(PERF_PASSWORD)
+        return self.bulk_create(
+            "Пользователи",
+            User,
+            (
+                User(
+                    email=f"{PERF_PREFIX}-{run + i}@example.com",
+                    username=f"{PERF_PREFIX}-{run + i}",
+                    first_name="Тест",
+                    last_name=f"Нагрузочный {run + i}",
+                    password=password,
+                )
+                for i in range(count)
+            ),
+        )
+
+    def create_tags(self):
+        return [
+            Tag.objects.get_or_create(
+                slug=f"{PERF_PREFIX}-{i}",
+                defaults={"name": f"{name} ({PERF_PREFIX})", "color": color},
+            )[0].id
+            for i, (name, color) in enumerate(PERF_TAGS)
+        ]
+
+    def create_ingredients(self, count):
+        names = [
+            f"{INGREDIENT_WORDS[i % len(INGREDIENT_WORDS)]} {PERF_PREFIX} {i}"
+            for i in range(count)
+        ]
+        ids = []
+        for batch in batched(names, 500):
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=name, measurement_unit=self.random.choice(UNITS)
+                    )
+                    for name in batch
+                ),
+                ignore_conflicts=True,
+            )
+            ids.extend(
+                Ingredient.objects.filter(name__in=batch).values_list(
+                    "id", flat=True
+                )
+            )
+        bump_version(INGREDIENTS_VERSION_KEY)
+        return ids
+
+    def create_recipes(self, count, authors, tags):
+        recipe_ids = self.bulk_create(
+            "Рецепты",
+            Recipe,
+            (
+                Recipe(
+                    author_id=self.random.choice(authors),
+                    name=f"Рецепт {PERF_PREFIX} {i}",
+                    text="Нарезать, смешать и готовить до готовности. " * 10,
+                    cooking_time=self.random.randint(5, 180),
+                    image=f"{PERF_PREFIX}.jpg",
+                )
+                for i in range(count)
+            ),
+        )
+        TagLink = Recipe.tags.through
+        self.bulk_create(
+            "Теги рецептов",
+            TagLink,
+            (
+                TagLink(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in self.random.sample(
+                    tags, self.random.randint(1, 3)
+                )
+            ),
+        )
+        return recipe_ids
+
+    def create_lines(self, recipes, ingredients, lines):
+        lines = min(lines, len(ingredients))
+        self.bulk_create(
+            "Ингредиенты рецептов",
+            IngredientInRecipe,
+            (
+                IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe_id in recipes
+                for ingredient_id in self.random.sample(ingredients, lines)
+            ),
+        )
+
+    def create_links(self, model, users, recipes, per_user):
+        per_user = min(per_user, len(recipes))
+        self.bulk_create(
+            model._meta.verbose_name_plural,
+            model,
+            (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in users
+                for recipe_id in self.random.sample(recipes, per_user)
+            ),
+        )
+
+    def create_subscriptions(self, users, authors, per_user):
+        self.bulk_create(
+            "Подписки",
+            Subscription,
+            (
+                Subscription(subscriber_id=user_id, subscribed_id=author_id)
+                for user_id in users
+                for author_id in self.random.sample(
+                    authors, min(per_user, len(authors))
+                )
+                if author_id != user_id
+            ),
+        )
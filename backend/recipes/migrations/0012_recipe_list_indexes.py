@@ -0,0 +1,31 @@
+# Generated by Django 3.2.13 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_ingredient_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ('-pub_date', '-id'), 'verbose_name': 'Рецепт', 'verbose_name_plural': 'Рецепты'},
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX recipe_in_favorites_user_recipe_idx '
+            'ON recipes_recipe_in_favorites (user_id, recipe_id)',
+            'DROP INDEX IF EXISTS recipe_in_favorites_user_recipe_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX recipe_in_baskets_user_recipe_idx '
+            'ON recipes_recipe_in_baskets (user_id, recipe_id)',
+            'DROP INDEX IF EXISTS recipe_in_baskets_user_recipe_idx',
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.13 on 2026-10-18 20:29
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_links(through):
+    links = (
+        through.objects.filter(recipe=models.OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(total=models.Count('pk'))
+        .values('total')
+    )
+    return Coalesce(models.Subquery(links), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(
+        favorites_count=count_links(Recipe.in_favorites.through),
+        in_carts_count=count_links(Recipe.in_baskets.through),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Добавили в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Добавили в корзину'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_favorites_count_idx'),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 3.2.13 on 2026-10-18 20:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+LINKS = (('in_favorites', 'Favorite'), ('in_baskets', 'CartItem'))
+
+
+def get_tables(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    quote_name = schema_editor.quote_name
+    for field, model_name in LINKS:
+        through = Recipe._meta.get_field(field).remote_field.through
+        model = apps.get_model('recipes', model_name)
+        yield (
+            quote_name(through._meta.db_table),
+            quote_name(model._meta.db_table),
+        )
+
+
+def copy_links(apps, schema_editor):
+    for old_table, new_table in get_tables(apps, schema_editor):
+        schema_editor.execute(
+            f'INSERT INTO {new_table} (user_id, recipe_id, created_at) '
+            f'SELECT user_id, recipe_id, CURRENT_TIMESTAMP FROM {old_table} '
+            'ORDER BY id'
+        )
+
+
+def restore_links(apps, schema_editor):
+    for old_table, new_table in get_tables(apps, schema_editor):
+        schema_editor.execute(
+            f'INSERT INTO {old_table} (user_id, recipe_id) '
+            f'SELECT user_id, recipe_id FROM {new_table}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0013_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время добавления')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Избранный рецепт',
+                'verbose_name_plural': 'Избранные рецепты',
+            },
+        ),
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время добавления')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Рецепт в корзине',
+                'verbose_name_plural': 'Рецепты в корзинах',
+            },
+        ),
+        migrations.RunPython(copy_links, restore_links),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='in_baskets',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='in_favorites',
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_baskets',
+            field=models.ManyToManyField(related_name='basket_recipes', through='recipes.CartItem', to=settings.AUTH_USER_MODEL, verbose_name='В корзинах у'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_favorites',
+            field=models.ManyToManyField(related_name='favor_recipes', through='recipes.Favorite', to=settings.AUTH_USER_MODEL, verbose_name='В избранных у'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='favorite_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='favorite_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='cartitem_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='cartitem_unique'),
+        ),
+    ]
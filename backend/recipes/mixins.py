@@ -1,5 +1,18 @@
+import gzip
+import hashlib
+
+import brotli
 from rest_framework import mixins, viewsets
 
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from backend.instrumentation import measure
+from backend.metrics import record_cache
+from .versions import get_version
+
 
 class ListRetrieveGenericViewSet(
     mixins.ListModelMixin,
@@ -7,3 +20,93 @@ class ListRetrieveGenericViewSet(
     viewsets.GenericViewSet,
 ):
     pass
+
+
+class PrecompressedListMixin:
+    """Serve list responses from pre-rendered, pre-compressed bodies.
+
+    Bodies are stored in the shared cache per value of
+    ``cache_query_params`` and keyed by the ``version_key`` stamp, so a
+    change of the underlying rows makes them unreachable.
+    """
+
+    version_key = None
+    cache_query_params = ()
+    cache_max_age = 60
+    payload_timeout = 60 * 60 * 24
+    encodings = ("br", "gzip")
+
+    def get_payload_cache_key(self, request):
+        params = "&".join(
+            f"{param}={request.query_params.get(param, '')}"
+            for param in self.cache_query_params
+        )
+        digest = hashlib.md5(params.encode()).hexdigest()
+        version = get_version(self.version_key)
+        return f"payload:{self.basename}:{version}:{digest}"
+
+    def get_uncached_list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def build_payload(self, request, *args, **kwargs):
+        with measure("serializer"):
+            response = self.get_uncached_list(request, *args, **kwargs)
+        renderer = request.accepted_renderer
+        body = renderer.render(
+            response.data,
+            request.accepted_media_type,
+            self.get_renderer_context(),
+        )
+        content_type = request.accepted_media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        etag = hashlib.md5(body).hexdigest()
+        return {
+            "identity": (body, f'"{etag}"'),
+            "gzip": (gzip.compress(body, compresslevel=9), f'"{etag}-gz"'),
+            "br": (brotli.compress(body), f'"{etag}-br"'),
+            "content_type": content_type,
+        }
+
+    def get_content_encoding(self, request):
+        accepted = {}
+        header = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        for item in header.split(","):
+            coding, _, params = item.strip().partition(";")
+            quality = params.strip().partition("q=")[2] or "1"
+            try:
+                accepted[coding.strip().lower()] = float(quality)
+            except ValueError:
+                continue
+        for encoding in self.encodings:
+            if accepted.get(encoding, 0) > 0:
+                return encoding
+        return "identity"
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return super().list(request, *args, **kwargs)
+        cache_key = self.get_payload_cache_key(request)
+        payload = cache.get(cache_key)
+        record_cache(
+            f"{self.basename}_payloads", payload is not None, payload is None
+        )
+        if payload is None:
+            payload = self.build_payload(request, *args, **kwargs)
+            cache.set(cache_key, payload, timeout=self.payload_timeout)
+
+        encoding = self.get_content_encoding(request)
+        body, etag = payload[encoding]
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if if_none_match and (
+            etag in parse_etags(if_none_match) or if_none_match == "*"
+        ):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type=payload["content_type"])
+            if encoding != "identity":
+                response["Content-Encoding"] = encoding
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
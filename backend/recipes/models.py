@@ -37,20 +37,39 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name="Изображение",
     )
+    renditions = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name="Уменьшенные копии изображения",
+    )
     in_favorites = models.ManyToManyField(
         to=User,
+        through="Favorite",
         related_name="favor_recipes",
         verbose_name="В избранных у",
     )
     in_baskets = models.ManyToManyField(
         to=User,
+        through="CartItem",
         related_name="basket_recipes",
         verbose_name="В корзинах у",
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Добавили в избранное",
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Добавили в корзину",
+    )
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name="Время публикации",
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Время изменения",
+    )
 
     class Meta:
         verbose_name = "Рецепт"
@@ -60,7 +79,16 @@ class Recipe(models.Model):
                 check=models.Q(cooking_time__gte=1), name="recipe_minvalue_1"
             ),
         )
-        ordering = ("-pub_date",)
+        indexes = (
+            models.Index(
+                fields=("-pub_date", "-id"), name="recipe_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=("-favorites_count", "-pub_date", "-id"),
+                name="recipe_favorites_count_idx",
+            ),
+        )
+        ordering = ("-pub_date", "-id")
 
     def __str__(self):
         return self.name
@@ -103,6 +131,112 @@ class IngredientInRecipe(models.Model):
         return f"{self.ingredient} ({self.amount})"
 
 
+class Favorite(models.Model):
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="favorites",
+        verbose_name="Пользователь",
+    )
+    recipe = models.ForeignKey(
+        to=Recipe,
+        on_delete=models.CASCADE,
+        related_name="favorites",
+        verbose_name="Рецепт",
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Время добавления",
+    )
+
+    class Meta:
+        verbose_name = "Избранный рецепт"
+        verbose_name_plural = "Избранные рецепты"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"), name="favorite_unique"
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=("user", "-created_at", "-id"),
+                name="favorite_user_created_idx",
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.user} - {self.recipe}"
+
+
+class CartItem(models.Model):
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="cart_items",
+        verbose_name="Пользователь",
+    )
+    recipe = models.ForeignKey(
+        to=Recipe,
+        on_delete=models.CASCADE,
+        related_name="cart_items",
+        verbose_name="Рецепт",
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Время добавления",
+    )
+
+    class Meta:
+        verbose_name = "Рецепт в корзине"
+        verbose_name_plural = "Рецепты в корзинах"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"), name="cartitem_unique"
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=("user", "-created_at", "-id"),
+                name="cartitem_user_created_idx",
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.user} - {self.recipe}"
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        to="Ingredient",
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Ингредиент",
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество",
+    )
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Списки покупок"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "ingredient"),
+                name="shoppinglistitem_unique",
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.ingredient} ({self.amount})"
+
+
 class Ingredient(models.Model):
     name = models.CharField(
         max_length=200,
@@ -2,10 +2,30 @@ from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 
+from backend.instrumentation import measure
+from backend.metrics import RECIPE_IMAGE_UPLOAD_BYTES
 from users.serializers import UserSerializer
+from .fields import (
+    BulkListSerializer,
+    BulkPrimaryKeyRelatedField,
+    BulkSlugRelatedField,
+    OrderedListSerializer,
+    RenditionsField,
+)
 from .models import Ingredient, IngredientInRecipe, Recipe, Tag
+from .services import (
+    CARTS,
+    FAVORITES,
+    add_to_shopping_list,
+    link_recipe,
+    lock_recipe,
+    remove_from_shopping_list,
+    unlink_recipe,
+    update_shopping_lists,
+    whole_recipe_change,
+)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -21,7 +41,7 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class IngrInRecipeSafeSerializer(serializers.ModelSerializer):
-    id = serializers.SlugRelatedField(
+    id = BulkSlugRelatedField(
         slug_field="id",
         queryset=Ingredient.objects.all(),
         source="ingredient",
@@ -40,19 +60,22 @@ class IngrInRecipeSafeSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientInRecipe
         fields = ("id", "name", "measurement_unit", "amount")
+        list_serializer_class = BulkListSerializer
 
 
 class RecipeShortPresentSerializer(serializers.ModelSerializer):
+    thumbnail = RenditionsField(size="thumbnail")
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "thumbnail", "cooking_time")
 
 
 class RecipeSafeSerializer(serializers.ModelSerializer):
-    tags = TagSerializer(many=True)
+    tags = OrderedListSerializer(child=TagSerializer())
     author = UserSerializer()
-    ingredients = IngrInRecipeSafeSerializer(
-        many=True,
+    ingredients = OrderedListSerializer(
+        child=IngrInRecipeSafeSerializer(),
         source="ingredients_in_recipe",
     )
     is_favorited = serializers.SerializerMethodField(
@@ -61,6 +84,7 @@ class RecipeSafeSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name="get_is_in_shopping_cart"
     )
+    renditions = RenditionsField()
 
     class Meta:
         model = Recipe
@@ -73,21 +97,30 @@ class RecipeSafeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "renditions",
             "text",
             "cooking_time",
         )
 
     def get_is_favorited(self, recipe):
         current_user = self.context.get("request").user
+        if not current_user.is_authenticated:
+            return False
+        if hasattr(recipe, "is_favorited"):
+            return recipe.is_favorited
         return recipe.in_favorites.filter(pk=current_user.id).exists()
 
     def get_is_in_shopping_cart(self, recipe):
         current_user = self.context.get("request").user
+        if not current_user.is_authenticated:
+            return False
+        if hasattr(recipe, "is_in_shopping_cart"):
+            return recipe.is_in_shopping_cart
         return recipe.in_baskets.filter(pk=current_user.id).exists()
 
 
 class RecipeUnsafeSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
     )
@@ -98,7 +131,12 @@ class RecipeUnsafeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = "__all__"
-        read_only_fields = ("in_favorites", "in_baskets")
+        read_only_fields = (
+            "in_favorites",
+            "in_baskets",
+            "favorites_count",
+            "in_carts_count",
+        )
 
     def populate_ingredients(self, valid_ingredients, recipe):
         ingredients_in_recipe = []
@@ -126,41 +164,87 @@ class RecipeUnsafeSerializer(serializers.ModelSerializer):
         )
         IngredientInRecipe.objects.bulk_create(ingredients_in_recipe)
         recipe.tags.set(tags)
-
-        recipe = (
-            Recipe.objects.select_related("author")
-            .prefetch_related("tags", "ingredients_in_recipe__ingredient")
-            .get(pk=recipe.id)
-        )
         return recipe
 
     @transaction.atomic()
     def update(self, recipe, validated_data):
         tags = validated_data.pop("tags", None)
-        valid_ingredients = validated_data.pop("ingredients", {})
+        valid_ingredients = validated_data.pop("ingredients", None)
 
+        if valid_ingredients is not None:
+            lock_recipe(recipe.id)
         for attr, value in validated_data.items():
             setattr(recipe, attr, value)
         recipe.save()
 
-        old_ingredients = recipe.ingredients_in_recipe.all()
-        old_ingredients.delete()
-        ingredients_in_recipe = self.populate_ingredients(
-            valid_ingredients, recipe
-        )
-        IngredientInRecipe.objects.bulk_create(ingredients_in_recipe)
-        recipe.tags.set(tags)
+        if valid_ingredients is not None:
+            self.update_ingredients(recipe, valid_ingredients)
+        if tags is not None:
+            self.update_tags(recipe, tags)
+        return recipe
 
-        recipe = (
-            Recipe.objects.select_related("author")
-            .prefetch_related("tags", "ingredients_in_recipe__ingredient")
-            .get(pk=recipe.id)
+    def update_ingredients(self, recipe, valid_ingredients):
+        """Write only the lines that were added, changed or removed."""
+        lines = {
+            line.ingredient_id: line
+            for line in recipe.ingredients_in_recipe.all()
+        }
+        old_amounts = {
+            ingredient_id: line.amount for ingredient_id, line in lines.items()
+        }
+        new_amounts = {
+            valid_ingredient["ingredient"].id: valid_ingredient["amount"]
+            for valid_ingredient in valid_ingredients
+        }
+
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            with whole_recipe_change(recipe):
+                recipe.ingredients_in_recipe.filter(
+                    ingredient_id__in=removed
+                ).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            line = lines.get(ingredient_id)
+            if line is not None and line.amount != amount:
+                line.amount = amount
+                changed.append(line)
+        IngredientInRecipe.objects.bulk_update(changed, ("amount",))
+        IngredientInRecipe.objects.bulk_create(
+            self.populate_ingredients(
+                (
+                    valid_ingredient
+                    for valid_ingredient in valid_ingredients
+                    if valid_ingredient["ingredient"].id not in lines
+                ),
+                recipe,
+            )
+        )
+        update_shopping_lists(recipe, old_amounts, new_amounts)
+
+    def update_tags(self, recipe, tags):
+        """Unlike ``set()``, add new tags in the order they were sent."""
+        old_tags = {tag.id for tag in recipe.tags.all()}
+        new_tags = {tag.id: tag for tag in tags}
+        removed = old_tags - new_tags.keys()
+        TagLink = Recipe.tags.through
+        if removed:
+            TagLink.objects.filter(recipe=recipe, tag_id__in=removed).delete()
+        TagLink.objects.bulk_create(
+            TagLink(recipe=recipe, tag=tag)
+            for tag_id, tag in new_tags.items()
+            if tag_id not in old_tags
         )
-        return recipe
+
+    def validate_image(self, image):
+        RECIPE_IMAGE_UPLOAD_BYTES.observe(image.size)
+        return image
 
     def validate(self, data):
         """Validate ingredients for uniqueness among themselves."""
         ingredients = data.get("ingredients")
+        if ingredients is None:
+            return data
         unique_ingredients = {ing.get("ingredient") for ing in ingredients}
         if len(ingredients) != len(unique_ingredients):
             raise serializers.ValidationError(
@@ -170,40 +254,54 @@ class RecipeUnsafeSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, instance):
-        return RecipeSafeSerializer(
-            instance=instance,
-            context=self.context,
-        ).data
+        """Render the saved recipe the way list and detail views do."""
+        from .fragments import (
+            apply_user_flags,
+            get_recipe_fragments,
+            render_fragments,
+        )
 
+        with measure("serializer"):
+            fragments = get_recipe_fragments((instance,), render_fragments)
+            return apply_user_flags(
+                self.context["request"], fragments[instance.id], instance
+            )
+
+
+class RecipeLinkSerializer(serializers.Serializer):
+    """Adds a recipe to, or removes it from, one of the user's lists."""
 
-class RecipeFavoriteSerializer(serializers.Serializer):
     recipe_id = serializers.IntegerField()
+    relation = None
+    already_linked_message = None
+    not_linked_message = None
 
-    def validate(self, data):
-        action = self.context.get("view").action
-        current_user = self.context.get("view").request.user
-        recipe_id = data.get("recipe_id")
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        is_in_favorite = recipe.in_favorites.filter(
-            pk=current_user.id
-        ).exists()
-
-        if action == "favorite" and is_in_favorite:
+    def get_user(self):
+        return self.context.get("request").user
+
+    def create(self, validated_data):
+        recipe, linked = link_recipe(
+            self.relation, validated_data["recipe_id"], self.get_user()
+        )
+        if recipe is None:
+            raise Http404
+        if not linked:
             raise serializers.ValidationError(
-                {"errors": "Рецепт уже есть в избранном."}
+                {"errors": [self.already_linked_message]}
             )
-        if action == "favorite_delete" and not is_in_favorite:
+        return recipe
+
+    def delete(self):
+        recipe, unlinked = unlink_recipe(
+            self.relation, self.validated_data["recipe_id"], self.get_user()
+        )
+        if recipe is None:
+            raise Http404
+        if not unlinked:
             raise serializers.ValidationError(
-                {"errors": "Этого рецепта нет в избранном."}
+                {"errors": [self.not_linked_message]}
             )
-        recipe.is_favorited = True
-        self.instance = recipe
-        return data
-
-    def save(self, **kwargs):
-        current_user = self.context.get("view").request.user
-        self.instance.in_favorites.add(current_user)
-        return self.instance
+        return recipe
 
     def to_representation(self, instance):
         return RecipeShortPresentSerializer(
@@ -212,37 +310,27 @@ class RecipeFavoriteSerializer(serializers.Serializer):
         ).data
 
 
-class RecipeShoppingCartSerializer(serializers.Serializer):
-    recipe_id = serializers.IntegerField()
+class RecipeFavoriteSerializer(RecipeLinkSerializer):
+    relation = FAVORITES
+    already_linked_message = "Рецепт уже есть в избранном."
+    not_linked_message = "Этого рецепта нет в избранном."
 
-    def validate(self, data):
-        action = self.context.get("view").action
-        current_user = self.context.get("view").request.user
-        recipe_id = data.get("recipe_id")
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        is_in_shopping_cart = recipe.in_baskets.filter(
-            pk=current_user.id
-        ).exists()
-
-        if action == "shopping_cart" and is_in_shopping_cart:
-            raise serializers.ValidationError(
-                {"errors": "Рецепт уже есть в списке покупок."}
-            )
-        if action == "shopping_cart_delete" and not is_in_shopping_cart:
-            raise serializers.ValidationError(
-                {"errors": "Рецепта нет в списке покупок."}
-            )
-        recipe.is_in_shopping_cart = True
-        self.instance = recipe
-        return data
 
-    def save(self, **kwargs):
-        current_user = self.context.get("view").request.user
-        self.instance.in_baskets.add(current_user)
-        return self.instance
+class RecipeShoppingCartSerializer(RecipeLinkSerializer):
+    relation = CARTS
+    already_linked_message = "Рецепт уже есть в списке покупок."
+    not_linked_message = "Рецепта нет в списке покупок."
 
-    def to_representation(self, instance):
-        return RecipeShortPresentSerializer(
-            instance=instance,
-            context=self.context,
-        ).data
+    @transaction.atomic()
+    def create(self, validated_data):
+        lock_recipe(validated_data["recipe_id"])
+        recipe = super().create(validated_data)
+        add_to_shopping_list(self.get_user(), recipe)
+        return recipe
+
+    @transaction.atomic()
+    def delete(self):
+        lock_recipe(self.validated_data["recipe_id"])
+        recipe = super().delete()
+        remove_from_shopping_list(self.get_user(), recipe)
+        return recipe
@@ -0,0 +1,280 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import CartItem, IngredientInRecipe, Recipe, ShoppingListItem
+
+FAVORITES = ("in_favorites", "favorites_count")
+CARTS = ("in_baskets", "in_carts_count")
+
+_whole_recipe_changes = threading.local()
+
+
+def get_recipe_amounts(recipe):
+    return dict(
+        recipe.ingredients_in_recipe.values_list("ingredient_id", "amount")
+    )
+
+
+def lock_recipe(recipe_id):
+    """Hold the recipe row until the transaction ends.
+
+    Adding a recipe to a cart reads its lines, and changing its lines
+    reads its carts. Both take this lock first, so neither misses the
+    other's uncommitted write. Without a transaction the lock would be
+    released at once, so it is not taken.
+    """
+    if (
+        connection.features.has_select_for_update
+        and connection.in_atomic_block
+    ):
+        list(
+            Recipe.objects.select_for_update()
+            .filter(pk=recipe_id)
+            .values_list("pk", flat=True)
+        )
+
+
+def apply_shopping_list_delta(user_ids, delta):
+    """Add ``{ingredient_id: amount}`` to the shopping lists of the users.
+
+    Negative amounts subtract, and items that drop to zero are removed.
+    Amounts never go below zero, even if a list has drifted from the
+    carts it is built from.
+    """
+    delta = {
+        ingredient_id: amount
+        for ingredient_id, amount in delta.items()
+        if amount
+    }
+    if not delta:
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+            for user_id in user_ids
+            for ingredient_id, amount in delta.items()
+            if amount > 0
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=delta
+    )
+    items.update(
+        amount=Greatest(
+            F("amount")
+            + Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in delta.items()
+                ),
+                default=Value(0),
+            ),
+            Value(0),
+        )
+    )
+    items.filter(amount=0).delete()
+
+
+def add_to_shopping_list(user, recipe):
+    apply_shopping_list_delta((user.id,), get_recipe_amounts(recipe))
+
+
+def remove_from_shopping_list(user, recipe):
+    delta = {
+        ingredient_id: -amount
+        for ingredient_id, amount in get_recipe_amounts(recipe).items()
+    }
+    apply_shopping_list_delta((user.id,), delta)
+
+
+def update_shopping_lists(recipe, old_amounts, new_amounts):
+    """Propagate a change of recipe ingredients to every cart holding it."""
+    delta = {
+        ingredient_id: new_amounts.get(ingredient_id, 0)
+        - old_amounts.get(ingredient_id, 0)
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    apply_shopping_list_delta(
+        recipe.in_baskets.values_list("id", flat=True), delta
+    )
+
+
+def get_whole_recipe_changes():
+    """Ids of recipes whose shopping list change is applied as one delta.
+
+    Saving or deleting single ingredient lines of these recipes leaves
+    the shopping lists to the code that changes the whole recipe.
+    """
+    if not hasattr(_whole_recipe_changes, "ids"):
+        _whole_recipe_changes.ids = set()
+    return _whole_recipe_changes.ids
+
+
+@contextmanager
+def whole_recipe_change(recipe):
+    recipe_id = recipe.id
+    recipe_ids = get_whole_recipe_changes()
+    recipe_ids.add(recipe_id)
+    try:
+        yield
+    finally:
+        recipe_ids.discard(recipe_id)
+
+
+def apply_line_changes(changes):
+    """Apply ``(recipe_id, ingredient_id, amount)`` line changes to carts.
+
+    Used for lines saved or deleted one by one, as the admin does.
+    """
+    deltas = defaultdict(Counter)
+    for recipe_id, ingredient_id, amount in changes:
+        if recipe_id not in get_whole_recipe_changes():
+            deltas[recipe_id][ingredient_id] += amount
+    for recipe_id, delta in deltas.items():
+        lock_recipe(recipe_id)
+        apply_shopping_list_delta(
+            CartItem.objects.filter(recipe_id=recipe_id).values_list(
+                "user_id", flat=True
+            ),
+            delta,
+        )
+
+
+LINK_SQL = """
+WITH linked AS (
+    INSERT INTO {link} (user_id, recipe_id, created_at)
+    SELECT %(user)s, id, %(now)s FROM {recipe} WHERE id = %(recipe)s
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+    RETURNING recipe_id
+), counted AS (
+    UPDATE {recipe} SET {counter} = {counter} + 1
+    WHERE id IN (SELECT recipe_id FROM linked)
+    RETURNING id
+)
+SELECT id, name, image, renditions, cooking_time,
+    EXISTS (SELECT 1 FROM counted) AS changed
+FROM {recipe} WHERE id = %(recipe)s
+"""
+
+UNLINK_SQL = """
+WITH unlinked AS (
+    DELETE FROM {link} WHERE user_id = %(user)s AND recipe_id = %(recipe)s
+    RETURNING recipe_id
+), counted AS (
+    UPDATE {recipe} SET {counter} = {counter} - 1
+    WHERE id IN (SELECT recipe_id FROM unlinked)
+    RETURNING id
+)
+SELECT id, name, image, renditions, cooking_time,
+    EXISTS (SELECT 1 FROM counted) AS changed
+FROM {recipe} WHERE id = %(recipe)s
+"""
+
+
+def run_link_statement(sql, relation, recipe_id, user):
+    field, counter = relation
+    quote_name = connection.ops.quote_name
+    sql = sql.format(
+        link=quote_name(getattr(Recipe, field).through._meta.db_table),
+        recipe=quote_name(Recipe._meta.db_table),
+        counter=quote_name(Recipe._meta.get_field(counter).column),
+    )
+    params = {"user": user.id, "recipe": recipe_id, "now": timezone.now()}
+    recipe = next(iter(Recipe.objects.raw(sql, params)), None)
+    if recipe is None:
+        return None, False
+    return recipe, recipe.changed
+
+
+def link_recipe(relation, recipe_id, user):
+    """Add the user to a recipe relation and bump its counter.
+
+    Returns the recipe and whether a link was created, or ``(None,
+    False)`` if there is no such recipe. On PostgreSQL this takes a
+    single INSERT ... ON CONFLICT DO NOTHING statement, so concurrent
+    requests can neither fail nor count twice.
+    """
+    if connection.vendor == "postgresql":
+        return run_link_statement(LINK_SQL, relation, recipe_id, user)
+    field, counter = relation
+    through = getattr(Recipe, field).through
+    with transaction.atomic():
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is None:
+            return None, False
+        _, created = through.objects.get_or_create(recipe=recipe, user=user)
+        if created:
+            Recipe.objects.filter(pk=recipe_id).update(
+                **{counter: F(counter) + 1}
+            )
+    return recipe, created
+
+
+def unlink_recipe(relation, recipe_id, user):
+    """Counterpart of ``link_recipe`` built on DELETE ... RETURNING."""
+    if connection.vendor == "postgresql":
+        return run_link_statement(UNLINK_SQL, relation, recipe_id, user)
+    field, counter = relation
+    through = getattr(Recipe, field).through
+    with transaction.atomic():
+        deleted, _ = through.objects.filter(
+            recipe_id=recipe_id, user=user
+        ).delete()
+        if deleted:
+            Recipe.objects.filter(pk=recipe_id).update(
+                **{counter: F(counter) - deleted}
+            )
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+    return recipe, bool(recipe and deleted)
+
+
+def count_links(relation):
+    """Subquery counting the users linked to each recipe."""
+    field, _ = relation
+    through = getattr(Recipe, field).through
+    links = (
+        through.objects.filter(recipe=OuterRef("pk"))
+        .order_by()
+        .values("recipe")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(links), 0)
+
+
+def get_live_shopping_lists(user_ids=None):
+    """Aggregate shopping lists straight from carts and recipe ingredients."""
+    if user_ids is None:
+        ingredients = IngredientInRecipe.objects.filter(
+            recipe__in_baskets__isnull=False
+        )
+    else:
+        # A single filter() call, so the cart table is joined only once.
+        ingredients = IngredientInRecipe.objects.filter(
+            recipe__in_baskets__in=user_ids
+        )
+    return (
+        ingredients.values_list("recipe__in_baskets", "ingredient_id")
+        .annotate(amount=Sum("amount"))
+        .order_by()
+    )
@@ -0,0 +1,137 @@
+import csv
+import hashlib
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ShoppingListItem
+from .versions import INGREDIENTS_VERSION_KEY, get_version
+
+EXPORT_CHUNK_SIZE = 2000
+MODIFIED_KEY = "shopping-cart-modified:{}"
+
+
+class Echo:
+    """Pseudo-buffer that hands written rows back to the csv writer."""
+
+    def write(self, value):
+        return value
+
+
+def get_cart_state(request):
+    """Return (ingredient id, amount) pairs of the user's shopping list."""
+    if not hasattr(request, "cart_state"):
+        request.cart_state = list(
+            ShoppingListItem.objects.filter(user=request.user)
+            .order_by("ingredient_id")
+            .values_list("ingredient_id", "amount")
+        )
+    return request.cart_state
+
+
+def get_export_format(request):
+    return request.query_params.get("file_format", "csv")
+
+
+def cart_etag(request, *args, **kwargs):
+    """Fingerprint of everything the export is rendered from.
+
+    That is the user's shopping list rows and the names and units of
+    ingredients, which change together with their version stamp.
+    """
+    if not hasattr(request, "cart_etag"):
+        state = ";".join(
+            f"{ingredient_id}:{amount}"
+            for ingredient_id, amount in get_cart_state(request)
+        )
+        export_format = get_export_format(request)
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        request.cart_etag = hashlib.md5(
+            f"{export_format}|{version}|{state}".encode()
+        ).hexdigest()
+    return request.cart_etag
+
+
+def cart_last_modified(request, *args, **kwargs):
+    """Time the export last changed, kept in the cache with its ETag.
+
+    No row dates every change of the export: removed lines leave nothing
+    behind and ingredient renames are not stamped on the list. So a new
+    time, always later than the previous one, is stored whenever the
+    ETag differs from the stored one.
+    """
+    key = MODIFIED_KEY.format(request.user.pk)
+    etag = cart_etag(request)
+    stored = cache.get(key)
+    if stored is not None and stored[0] == etag:
+        return stored[1]
+    modified = timezone.now().replace(microsecond=0)
+    if stored is not None and modified <= stored[1]:
+        modified = stored[1] + timedelta(seconds=1)
+    cache.set(key, (etag, modified), timeout=None)
+    return modified
+
+
+def get_ingredient_amounts(user):
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values_list(
+            "ingredient__name", "ingredient__measurement_unit", "amount"
+        )
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def render_csv(ingredient_amounts):
+    writer = csv.writer(Echo())
+    for name, unit, amount in ingredient_amounts:
+        yield writer.writerow([name, amount, unit])
+
+
+def render_text(ingredient_amounts):
+    for name, unit, amount in ingredient_amounts:
+        yield f"{name} ({unit}) — {amount}\n"
+
+
+def render_pdf(ingredient_amounts):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    font_name = "ShoppingCartFont"
+    if font_name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(font_name, settings.SHOPPING_CART_PDF_FONT)
+        )
+    font_size = 12
+    leading = font_size * 1.5
+    margin = 50
+    _, page_height = A4
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle("Список покупок")
+    text = pdf.beginText(margin, page_height - margin)
+    text.setFont(font_name, font_size, leading)
+    for name, unit, amount in ingredient_amounts:
+        if text.getY() < margin:
+            pdf.drawText(text)
+            pdf.showPage()
+            text = pdf.beginText(margin, page_height - margin)
+            text.setFont(font_name, font_size, leading)
+        text.textLine(f"{name} ({unit}) — {amount}")
+    pdf.drawText(text)
+    pdf.save()
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", render_csv),
+    "txt": ("text/plain; charset=utf-8", render_text),
+    "pdf": ("application/pdf", render_pdf),
+}
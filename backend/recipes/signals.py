@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .fragments import drop_recipe_fragments
+from .images import needs_renditions, schedule_renditions
+from .models import CartItem, Ingredient, IngredientInRecipe, Recipe, Tag
+from .services import (
+    CARTS,
+    FAVORITES,
+    apply_line_changes,
+    get_recipe_amounts,
+    lock_recipe,
+    update_shopping_lists,
+)
+from .versions import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY, bump_version
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump_version(INGREDIENTS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_version(TAGS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    drop_recipe_fragments((instance.id,))
+
+
+@receiver(post_save, sender=Recipe)
+def render_recipe_image(instance, **kwargs):
+    if needs_renditions(instance):
+        schedule_renditions(instance)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_author_recipes(instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(("last_login",)):
+        return
+    drop_recipe_fragments(
+        Recipe.objects.filter(author=instance).values_list("id", flat=True)
+    )
+
+
+@receiver(pre_delete, sender=get_user_model())
+def release_recipe_counters(instance, **kwargs):
+    for field, counter in (FAVORITES, CARTS):
+        Recipe.objects.filter(**{field: instance}).update(
+            **{counter: F(counter) - 1}
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def release_shopping_lists(instance, **kwargs):
+    """Subtract a deleted recipe from every cart, including cascades.
+
+    The recipe's cart items are deleted right away, inside the delete's
+    transaction, so its lines, deleted one by one afterwards, find no
+    carts to subtract from again.
+    """
+    lock_recipe(instance.id)
+    update_shopping_lists(instance, get_recipe_amounts(instance), {})
+    CartItem.objects.filter(recipe=instance).delete()
+
+
+@receiver(pre_save, sender=IngredientInRecipe)
+def remember_line(instance, raw, **kwargs):
+    instance.saved_line = None
+    if not raw and instance.pk is not None:
+        instance.saved_line = (
+            IngredientInRecipe.objects.filter(pk=instance.pk)
+            .values_list("recipe_id", "ingredient_id", "amount")
+            .first()
+        )
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def update_line(instance, raw, **kwargs):
+    if raw:
+        return
+    changes = [(instance.recipe_id, instance.ingredient_id, instance.amount)]
+    if instance.saved_line is not None:
+        recipe_id, ingredient_id, amount = instance.saved_line
+        changes.append((recipe_id, ingredient_id, -amount))
+    apply_line_changes(changes)
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def release_line(instance, **kwargs):
+    apply_line_changes(
+        ((instance.recipe_id, instance.ingredient_id, -instance.amount),)
+    )
@@ -0,0 +1,1146 @@
+import base64
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from operator import itemgetter
+from pathlib import Path
+from unittest import skipUnless
+
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, reset_queries, transaction
+from django.db.models.signals import pre_delete
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import parse_http_date
+
+from backend.urls import router
+from users.models import Subscription
+from .fragments import (
+    apply_user_flags,
+    get_fragment_key,
+    render_fragments,
+)
+from .models import (
+    CartItem,
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingListItem,
+    Tag,
+)
+from .serializers import RecipeSafeSerializer, RecipeUnsafeSerializer
+from .services import (
+    CARTS,
+    FAVORITES,
+    LINK_SQL,
+    UNLINK_SQL,
+    add_to_shopping_list,
+    get_live_shopping_lists,
+    get_whole_recipe_changes,
+    link_recipe,
+    remove_from_shopping_list,
+    unlink_recipe,
+)
+
+User = get_user_model()
+
+RECIPES = 8
+RECIPE_LIST_URL = "/api/recipes/"
+
+
+class RecipeListQueriesTest(APITestCase):
+    """The recipe list issues a fixed number of queries per page.
+
+    Counts are taken with a cold fragment cache, so a query per recipe,
+    author, tag or ingredient line shows up as a page-size dependent
+    count and fails the test.
+    """
+
+    list_queries = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="reader@example.com", username="reader", password="pass"
+        )
+        authors = [
+            User.objects.create_user(
+                email=f"author-{number}@example.com",
+                username=f"author-{number}",
+                password="pass",
+            )
+            for number in range(2)
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f"Тег {number}", color=color, slug=f"tag-{number}"
+            )
+            for number, color in enumerate(("#FF0000", "#0000FF"))
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"Ингредиент {number}", measurement_unit="г"
+            )
+            for number in range(3)
+        ]
+        for number in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=authors[number % len(authors)],
+                name=f"Рецепт {number}",
+                text="Смешать.",
+                cooking_time=10,
+                image="recipes/images/test.png",
+            )
+            recipe.tags.set(cls.tags[: number % len(cls.tags) + 1])
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                )
+                for ingredient in ingredients
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def assert_list_queries(self, query, results):
+        with self.assertNumQueries(self.list_queries):
+            response = self.client.get(f"{RECIPE_LIST_URL}?{query}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), results)
+        return response
+
+    def test_page_sizes(self):
+        for limit in (2, 6):
+            with self.subTest(limit=limit):
+                cache.clear()
+                self.assert_list_queries(f"limit={limit}", limit)
+
+    def test_is_favorited_filter(self):
+        for limit in (2, 4):
+            with self.subTest(limit=limit):
+                cache.clear()
+                response = self.assert_list_queries(
+                    f"is_favorited=1&limit={limit}", limit
+                )
+                self.assertTrue(
+                    all(
+                        recipe["is_favorited"]
+                        for recipe in response.data["results"]
+                    )
+                )
+
+    def test_tags_filter(self):
+        for limit in (2, 4):
+            with self.subTest(limit=limit):
+                cache.clear()
+                self.assert_list_queries(
+                    f"tags={self.tags[1].slug}&limit={limit}", limit
+                )
+
+    def test_cursor_refuses_favorites_ordering(self):
+        response = self.client.get(
+            RECIPE_LIST_URL,
+            {"pagination": "cursor", "ordering": "-favorites_count"},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ordering", response.data)
+
+
+class ShoppingCartExportTest(APITestCase):
+    """The export's validators follow the shopping list and ingredients."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="buyer@example.com", username="buyer", password="pass"
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name="Мука", measurement_unit="г"
+        )
+        cls.recipes = []
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name=f"Пирог {number}",
+                text="Испечь.",
+                cooking_time=40,
+                image="recipes/images/test.png",
+            )
+            IngredientInRecipe.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=100
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f"/api/recipes/{self.recipes[1].id}/shopping_cart/")
+
+    def download(self, etag=None, modified_since=None):
+        headers = {}
+        if etag is not None:
+            headers["HTTP_IF_NONE_MATCH"] = etag
+        if modified_since is not None:
+            headers["HTTP_IF_MODIFIED_SINCE"] = modified_since
+        return self.client.get(
+            "/api/recipes/download_shopping_cart/", **headers
+        )
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.download()["ETag"]
+        self.assertEqual(self.download(etag).status_code, 304)
+
+    def test_ingredient_rename_changes_etag(self):
+        etag = self.download()["ETag"]
+        self.ingredient.name = "Мука пшеничная"
+        self.ingredient.save()
+        response = self.download(etag)
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("Мука пшеничная", content)
+
+    def test_cart_changes_change_etag(self):
+        cart_url = f"/api/recipes/{self.recipes[0].id}/shopping_cart/"
+        etag = self.download()["ETag"]
+        self.client.post(cart_url)
+        response = self.download(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("200", b"".join(response.streaming_content).decode())
+        self.client.delete(cart_url)
+        self.assertEqual(self.download(etag).status_code, 304)
+
+    def test_last_modified_moves_on_every_change(self):
+        cart_url = f"/api/recipes/{self.recipes[0].id}/shopping_cart/"
+        modified = self.download()["Last-Modified"]
+        self.assertEqual(
+            self.download(modified_since=modified).status_code, 304
+        )
+        self.client.post(cart_url)
+        modified = self.download()["Last-Modified"]
+        self.client.delete(cart_url)
+        response = self.download(modified_since=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(
+            parse_http_date(response["Last-Modified"]),
+            parse_http_date(modified),
+        )
+
+    def test_unknown_format_is_rejected_before_caching(self):
+        response = self.client.get(
+            "/api/recipes/download_shopping_cart/?file_format=doc"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("file_format", response.json())
+        self.assertNotIn("ETag", response)
+
+
+class ShoppingListSignalsTest(APITestCase):
+    """Shopping lists follow writes made outside the API, as in the admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="cook@example.com", username="cook", password="pass"
+        )
+        cls.buyers = [
+            User.objects.create_user(
+                email=f"buyer-{number}@example.com",
+                username=f"buyer-{number}",
+                password="pass",
+            )
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("Мука", "Сахар", "Соль")
+        ]
+        cls.recipes = []
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=f"Пирог {number}",
+                text="Испечь.",
+                cooking_time=40,
+                image="recipes/images/test.png",
+            )
+            for ingredient in cls.ingredients[:2]:
+                IngredientInRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+            cls.recipes.append(recipe)
+        for buyer in cls.buyers:
+            for recipe in cls.recipes:
+                CartItem.objects.create(user=buyer, recipe=recipe)
+                add_to_shopping_list(buyer, recipe)
+
+    def assert_lists_match(self):
+        self.assertEqual(
+            set(
+                ShoppingListItem.objects.values_list(
+                    "user_id", "ingredient_id", "amount"
+                )
+            ),
+            set(get_live_shopping_lists()),
+        )
+
+    def test_line_added_changed_and_deleted(self):
+        line = IngredientInRecipe.objects.create(
+            recipe=self.recipes[0], ingredient=self.ingredients[2], amount=5
+        )
+        self.assert_lists_match()
+        line.amount = 7
+        line.save()
+        self.assert_lists_match()
+        line.ingredient = self.ingredients[0]
+        IngredientInRecipe.objects.filter(
+            recipe=self.recipes[0], ingredient=self.ingredients[0]
+        ).delete()
+        line.save()
+        self.assert_lists_match()
+        line.delete()
+        self.assert_lists_match()
+
+    def test_recipe_deleted(self):
+        self.recipes[0].delete()
+        self.assert_lists_match()
+
+    def test_author_deleted(self):
+        self.author.delete()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_api_update_applies_delta_once(self):
+        self.client.force_authenticate(user=self.author)
+        response = self.client.patch(
+            f"/api/recipes/{self.recipes[0].id}/",
+            {
+                "ingredients": [
+                    {"id": self.ingredients[1].id, "amount": 50},
+                    {"id": self.ingredients[2].id, "amount": 10},
+                ],
+                "tags": [],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_lists_match()
+
+    def test_api_delete_applies_recipe_once(self):
+        self.client.force_authenticate(user=self.author)
+        response = self.client.delete(f"/api/recipes/{self.recipes[0].id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assert_lists_match()
+        self.assertFalse(get_whole_recipe_changes())
+
+    def test_drifted_list_does_not_go_below_zero(self):
+        ShoppingListItem.objects.filter(user=self.buyers[0]).update(amount=1)
+        remove_from_shopping_list(self.buyers[0], self.recipes[0])
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.buyers[0]).exists()
+        )
+
+    def test_failed_delete_leaves_lines_tracked(self):
+        def fail(**kwargs):
+            raise RuntimeError
+
+        recipe = self.recipes[0]
+        pre_delete.connect(fail, sender=Recipe)
+        try:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                recipe.delete()
+        finally:
+            pre_delete.disconnect(fail, sender=Recipe)
+        self.assertFalse(get_whole_recipe_changes())
+        IngredientInRecipe.objects.filter(recipe=recipe).first().delete()
+        self.assert_lists_match()
+
+
+class IngredientSearchTest(APITestCase):
+    """The in-memory index and the database filter find the same rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ("сахар", "сахарная пудра", "тростниковый сахар", "соль"):
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def search(self, term):
+        cache.clear()
+        response = self.client.get("/api/ingredients/", {"name": term})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.json()]
+
+    def test_index_matches_database_filter(self):
+        for term in ("сах", "пудр", "мёд"):
+            with self.subTest(term=term):
+                with override_settings(INGREDIENT_SEARCH_INDEX=True):
+                    from_index = self.search(term)
+                with override_settings(INGREDIENT_SEARCH_INDEX=False):
+                    from_database = self.search(term)
+                self.assertEqual(from_index, from_database)
+        self.assertEqual(
+            self.search("сах"),
+            ["сахар", "сахарная пудра", "тростниковый сахар"],
+        )
+
+
+class LoadIngredientsTest(APITestCase):
+    """load_ingredients upserts by name and can be run again."""
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def write(self, name, content, encoding="utf-8"):
+        path = self.directory / name
+        path.write_text(content, encoding=encoding)
+        return str(path)
+
+    def load(self, *args):
+        call_command("load_ingredients", *args, stdout=StringIO())
+        return dict(Ingredient.objects.values_list("name", "measurement_unit"))
+
+    def test_csv_and_json_reruns(self):
+        csv_path = self.write(
+            "ingredients.csv",
+            "Column1;Column2\nмука;г\nмолоко;мл\nмука;кг\n",
+            encoding="cp1251",
+        )
+        json_path = self.write(
+            "ingredients.json",
+            json.dumps(
+                [
+                    {"name": "молоко", "measurement_unit": "л"},
+                    {"name": "яйцо", "measurement_unit": "шт"},
+                ],
+                ensure_ascii=False,
+            ),
+        )
+        csv_args = (
+            csv_path,
+            "--encoding=cp1251",
+            "--delimiter=;",
+            "--skip-header",
+        )
+        loaded = {"мука": "кг", "молоко": "мл"}
+        for _ in range(2):
+            self.assertEqual(self.load(*csv_args), loaded)
+        loaded.update({"молоко": "л", "яйцо": "шт"})
+        for _ in range(2):
+            self.assertEqual(self.load(json_path), loaded)
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_unreadable_files(self):
+        path = self.write("ingredients.csv", "мука;г\n", encoding="cp1251")
+        with self.assertRaisesMessage(CommandError, "--encoding"):
+            self.load(path)
+        path = self.write("long.csv", "мука," + "г" * 200000 + "\n")
+        with self.assertRaisesMessage(CommandError, "--delimiter"):
+            self.load(path)
+        self.assertFalse(Ingredient.objects.exists())
+
+
+class RecipeLinkToggleTest(APITestCase):
+    """Favorite and cart toggles refuse to repeat themselves."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="fan@example.com", username="fan", password="pass"
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user,
+            name="Блины",
+            text="Смешать и пожарить.",
+            cooking_time=20,
+            image="recipes/images/test.png",
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def test_repeated_toggles_are_rejected(self):
+        for action, link, counter in (
+            ("favorite", Favorite, "favorites_count"),
+            ("shopping_cart", CartItem, "in_carts_count"),
+        ):
+            url = f"{RECIPE_LIST_URL}{self.recipe.id}/{action}/"
+            with self.subTest(action=action):
+                self.assertEqual(self.client.post(url).status_code, 200)
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("errors", response.data)
+                self.assertEqual(link.objects.count(), 1)
+                self.recipe.refresh_from_db()
+                self.assertEqual(getattr(self.recipe, counter), 1)
+
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                response = self.client.delete(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("errors", response.data)
+                self.assertEqual(link.objects.count(), 0)
+                self.recipe.refresh_from_db()
+                self.assertEqual(getattr(self.recipe, counter), 0)
+
+    def test_unknown_recipe(self):
+        for action in ("favorite", "shopping_cart"):
+            url = f"{RECIPE_LIST_URL}9001/{action}/"
+            with self.subTest(action=action):
+                self.assertEqual(self.client.post(url).status_code, 404)
+                self.assertEqual(self.client.delete(url).status_code, 404)
+
+
+@skipUnless(connection.vendor == "postgresql", "PostgreSQL statements")
+class LinkStatementTest(RecipeLinkToggleTest):
+    """On PostgreSQL every link and unlink is a single statement."""
+
+    def test_single_statements(self):
+        for relation, link, counter in (
+            (FAVORITES, Favorite, "favorites_count"),
+            (CARTS, CartItem, "in_carts_count"),
+        ):
+            with self.subTest(relation=relation[0]):
+                for toggle, sql, changes in (
+                    (link_recipe, LINK_SQL, (True, False)),
+                    (unlink_recipe, UNLINK_SQL, (True, False)),
+                ):
+                    for changed in changes:
+                        with CaptureQueriesContext(connection) as queries:
+                            recipe, result = toggle(
+                                relation, self.recipe.id, self.user
+                            )
+                        self.assertEqual(len(queries), 1)
+                        self.assertEqual(
+                            queries[0]["sql"].split()[:2], sql.split()[:2]
+                        )
+                        self.assertEqual(result, changed)
+                        self.assertEqual(recipe.name, self.recipe.name)
+                    self.recipe.refresh_from_db()
+                    self.assertEqual(
+                        getattr(self.recipe, counter),
+                        int(toggle is link_recipe),
+                    )
+                    self.assertEqual(
+                        link.objects.exists(), toggle is link_recipe
+                    )
+                self.assertEqual(
+                    link_recipe(relation, 9001, self.user), (None, False)
+                )
+                self.assertEqual(
+                    unlink_recipe(relation, 9001, self.user), (None, False)
+                )
+
+
+class RecipeCountersTest(APITestCase):
+    """Favorite and cart counters follow the links they count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email="owner@example.com", username="owner", password="pass"
+        )
+        cls.users = [
+            User.objects.create_user(
+                email=f"guest-{number}@example.com",
+                username=f"guest-{number}",
+                password="pass",
+            )
+            for number in range(2)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f"Салат {number}",
+                text="Нарезать.",
+                cooking_time=5,
+                image="recipes/images/test.png",
+            )
+            for number in range(2)
+        ]
+
+    def toggle(self, method, user, recipe, action):
+        self.client.force_authenticate(user=user)
+        response = getattr(self.client, method)(
+            f"{RECIPE_LIST_URL}{recipe.id}/{action}/"
+        )
+        self.assertLess(response.status_code, 300)
+
+    def assert_counters(self, *expected):
+        self.assertEqual(
+            list(
+                Recipe.objects.order_by("id").values_list(
+                    "favorites_count", "in_carts_count"
+                )
+            ),
+            list(expected),
+        )
+
+    def test_counters_go_up_and_down(self):
+        first, second = self.users
+        for user in self.users:
+            self.toggle("post", user, self.recipes[0], "favorite")
+            self.toggle("post", user, self.recipes[0], "shopping_cart")
+        self.toggle("post", first, self.recipes[1], "shopping_cart")
+        self.assert_counters((2, 2), (0, 1))
+
+        self.toggle("delete", second, self.recipes[0], "favorite")
+        self.toggle("delete", first, self.recipes[1], "shopping_cart")
+        self.assert_counters((1, 2), (0, 0))
+
+        self.toggle("post", first, self.recipes[1], "favorite")
+        first.delete()
+        self.assert_counters((0, 1), (0, 0))
+        call_command(
+            "reconcile_recipe_counters", verify=True, stdout=StringIO()
+        )
+
+    def test_reconcile_fixes_drift(self):
+        Favorite.objects.create(user=self.users[0], recipe=self.recipes[0])
+        Recipe.objects.update(favorites_count=5, in_carts_count=3)
+        with self.assertRaises(CommandError):
+            call_command(
+                "reconcile_recipe_counters", verify=True, stdout=StringIO()
+            )
+        call_command("reconcile_recipe_counters", stdout=StringIO())
+        self.assert_counters((1, 0), (0, 0))
+
+
+class RecipeFragmentTest(APITestCase):
+    """Fragments render the same bytes as ``RecipeSafeSerializer``."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email="cook@example.com",
+            username="cook",
+            first_name="Анна",
+            last_name="Повар",
+            password="pass",
+        )
+        tags = [
+            Tag.objects.create(
+                name=f"Тег {number}",
+                color=f"#00000{number}",
+                slug=f"tag-{number}",
+            )
+            for number in range(4)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент {number}", measurement_unit="г"
+            )
+            for number in range(4)
+        ]
+        cls.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f"Пирог {number}",
+                text="Испечь.",
+                cooking_time=40,
+                image="recipes/images/test.png",
+            )
+            # Links and lines are added out of id order on purpose.
+            for tag in reversed(tags[number:]):
+                recipe.tags.add(tag)
+            for ingredient in reversed(ingredients[number:]):
+                IngredientInRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10 + number
+                )
+            cls.recipes.append(recipe)
+
+    def test_fragments_match_serializer(self):
+        request = Request(APIRequestFactory().get(RECIPE_LIST_URL))
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        recipes = (
+            Recipe.objects.select_related("author")
+            .prefetch_related("ingredients_in_recipe__ingredient", "tags")
+            .filter(pk__in=recipe_ids)
+        )
+        fragments = render_fragments(recipe_ids)
+        renderer = JSONRenderer()
+        for recipe in recipes:
+            with self.subTest(recipe=recipe.name):
+                self.assertEqual(
+                    renderer.render(
+                        apply_user_flags(request, fragments[recipe.id], recipe)
+                    ),
+                    renderer.render(
+                        RecipeSafeSerializer(
+                            recipe, context={"request": request}
+                        ).data
+                    ),
+                )
+
+
+class RecipeCacheInvalidationTest(APITestCase):
+    """Cached recipe output follows every change it is built from."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="baker@example.com",
+            username="baker",
+            first_name="Иван",
+            last_name="Пекарь",
+            password="pass",
+        )
+        cls.tag = Tag.objects.create(
+            name="Выпечка", color="#AA5500", slug="bakery"
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name="Хлеб",
+            text="Замесить и испечь.",
+            cooking_time=90,
+            image="recipes/images/test.png",
+        )
+        cls.recipe.tags.set((cls.tag,))
+        IngredientInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=500
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.author)
+        self.detail_url = f"{RECIPE_LIST_URL}{self.recipe.id}/"
+        self.assertEqual(self.get_detail()["name"], "Хлеб")
+        self.assertEqual(self.get_listed()["name"], "Хлеб")
+        self.assertIsNotNone(cache.get(get_fragment_key(self.recipe.id)))
+
+    def get_detail(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get_list(self):
+        response = self.client.get(RECIPE_LIST_URL)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def get_listed(self):
+        (recipe,) = self.get_list()
+        return recipe
+
+    def assert_refreshed(self, read, expected):
+        for source in (self.get_detail, self.get_listed):
+            with self.subTest(source=source.__name__):
+                self.assertEqual(read(source()), expected)
+
+    def test_patch(self):
+        response = self.client.patch(
+            self.detail_url, {"name": "Ржаной хлеб"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_refreshed(itemgetter("name"), "Ржаной хлеб")
+
+    def test_tag_rename(self):
+        self.tag.name = "Хлеб и выпечка"
+        self.tag.save()
+        self.assert_refreshed(
+            lambda recipe: recipe["tags"][0]["name"], "Хлеб и выпечка"
+        )
+
+    def test_ingredient_rename(self):
+        self.ingredient.name = "ржаная мука"
+        self.ingredient.save()
+        self.assert_refreshed(
+            lambda recipe: recipe["ingredients"][0]["name"], "ржаная мука"
+        )
+
+    def test_author_rename(self):
+        self.author.first_name = "Пётр"
+        self.author.save()
+        self.assert_refreshed(
+            lambda recipe: recipe["author"]["first_name"], "Пётр"
+        )
+
+    def test_delete(self):
+        response = self.client.delete(self.detail_url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.assertEqual(self.get_list(), [])
+
+
+class RecipePartialUpdateTest(APITestCase):
+    """PATCH writes only the parts of a recipe it was sent."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="chef@example.com", username="chef", password="pass"
+        )
+        cls.tag = Tag.objects.create(
+            name="Завтрак", color="#00FF00", slug="breakfast"
+        )
+        ingredient = Ingredient.objects.create(
+            name="яйцо", measurement_unit="шт"
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name="Омлет",
+            text="Взбить и пожарить.",
+            cooking_time=10,
+            image="recipes/images/test.png",
+        )
+        cls.recipe.tags.set((cls.tag,))
+        IngredientInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=ingredient, amount=3
+        )
+
+    def test_name_only_patch_keeps_lines_and_tags(self):
+        self.client.force_authenticate(user=self.author)
+        tables = (
+            IngredientInRecipe._meta.db_table,
+            Recipe.tags.through._meta.db_table,
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f"/api/recipes/{self.recipe.id}/",
+                {"name": "Пышный омлет"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["name"], "Пышный омлет")
+        writes = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+            and any(table in query["sql"] for table in tables)
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(len(response.data["ingredients"]), 1)
+        self.assertEqual(
+            [tag["id"] for tag in response.data["tags"]], [self.tag.id]
+        )
+
+
+class RecipePayloadLookupTest(APITestCase):
+    """Ingredient and tag ids of a payload are resolved in bulk."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="cook-2@example.com", username="cook-2", password="pass"
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f"Метка {number}",
+                color=f"#10000{number}",
+                slug=f"label-{number}",
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"специя {number}", measurement_unit="г"
+            )
+            for number in range(5)
+        ]
+
+    def get_payload(self, tag_ids, ingredient_ids):
+        return {
+            "name": "Суп",
+            "text": "Сварить.",
+            "cooking_time": 30,
+            "image": make_image(),
+            "tags": tag_ids,
+            "ingredients": [
+                {"id": ingredient_id, "amount": 5}
+                for ingredient_id in ingredient_ids
+            ],
+        }
+
+    def test_one_query_per_relation(self):
+        request = Request(APIRequestFactory().post(RECIPE_LIST_URL))
+        request.user = self.author
+        serializer = RecipeUnsafeSerializer(
+            data=self.get_payload(
+                [tag.id for tag in self.tags],
+                [ingredient.id for ingredient in self.ingredients],
+            ),
+            context={"request": request},
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        tables = [
+            model._meta.db_table
+            for model in (Tag, Ingredient)
+            for query in queries
+            if f'"{model._meta.db_table}"' in query["sql"]
+        ]
+        self.assertEqual(
+            tables, [Tag._meta.db_table, Ingredient._meta.db_table]
+        )
+        self.assertEqual(len(serializer.validated_data["ingredients"]), 5)
+
+    def test_all_unknown_ids_are_reported(self):
+        self.client.force_authenticate(user=self.author)
+        response = self.client.post(
+            RECIPE_LIST_URL,
+            self.get_payload(
+                [self.tags[0].id, 9001, 9002],
+                [9003, self.ingredients[0].id, 9004],
+            ),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [error.code for error in response.data["tags"]],
+            ["does_not_exist", "does_not_exist"],
+        )
+        self.assertEqual(
+            [
+                [error.code for error in line.get("id", ())]
+                for line in response.data["ingredients"]
+            ],
+            [["does_not_exist"], [], ["does_not_exist"]],
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeRenditionsTest(APITestCase):
+    """Renditions are queued when the image changes, and only then."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="photo@example.com", username="photo", password="pass"
+        )
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def assert_scheduled(self, change, scheduled):
+        with self.captureOnCommitCallbacks() as callbacks:
+            change()
+        self.assertEqual(len(callbacks), scheduled)
+
+    def mark_rendered(self, recipe):
+        Recipe.objects.filter(pk=recipe.pk).update(
+            renditions={"source": recipe.image.name, "sizes": {}}
+        )
+        recipe.refresh_from_db()
+
+    def test_model_saves(self):
+        recipe = Recipe(
+            author=self.author,
+            name="Торт",
+            text="Испечь.",
+            cooking_time=60,
+            image="recipes/images/cake.png",
+        )
+        self.assert_scheduled(recipe.save, 1)
+        self.mark_rendered(recipe)
+
+        recipe.name = "Медовый торт"
+        self.assert_scheduled(recipe.save, 0)
+        recipe.image = "recipes/images/honey-cake.png"
+        self.assert_scheduled(recipe.save, 1)
+
+    def test_api_updates(self):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name="Кекс",
+            text="Испечь.",
+            cooking_time=45,
+            image="recipes/images/muffin.png",
+        )
+        self.mark_rendered(recipe)
+        self.client.force_authenticate(user=self.author)
+        url = f"{RECIPE_LIST_URL}{recipe.id}/"
+
+        def patch(data):
+            response = self.client.patch(url, data, format="json")
+            self.assertEqual(response.status_code, 200)
+
+        self.assert_scheduled(lambda: patch({"name": "Кекс с изюмом"}), 0)
+        self.assert_scheduled(lambda: patch({"image": make_image()}), 1)
+
+
+BUDGET_SIZES = {
+    "small": {
+        "users": 10,
+        "recipes": 20,
+        "ingredients": 30,
+        "lines": 3,
+        "favorites": 3,
+        "carts": 2,
+        "subscriptions": 3,
+    },
+    "large": {
+        "users": 30,
+        "recipes": 90,
+        "ingredients": 90,
+        "lines": 9,
+        "favorites": 9,
+        "carts": 6,
+        "subscriptions": 9,
+    },
+}
+BUDGET_LIST_LIMIT = 100
+METHOD_ORDER = ("get", "post", "patch", "put", "delete")
+SAVEPOINT_STATEMENTS = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO")
+
+
+def make_image():
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), "#E26C2D").save(buffer, format="PNG")
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/png;base64,{encoded}"
+
+
+class QueryBudgetTest(APITestCase):
+    """Every router action keeps its number of queries on any data size.
+
+    Each action runs on two seed_perf datasets. Its count must not grow
+    with the data and must stay within the ``query_budgets`` of its
+    viewset. The budgets were measured on SQLite and are only enforced
+    there: on PostgreSQL ``link_recipe`` takes a single statement, so
+    favorite and cart toggles issue different counts.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, True)
+
+    def test_query_budgets(self):
+        counts = {}
+        with override_settings(MEDIA_ROOT=self.media_root):
+            for size, params in BUDGET_SIZES.items():
+                with transaction.atomic():
+                    cache.clear()
+                    call_command("seed_perf", stdout=StringIO(), **params)
+                    counts[size] = self.run_routes(params)
+                    transaction.set_rollback(True)
+        enforce_budgets = connection.vendor == "sqlite"
+        for key, large in counts["large"].items():
+            viewset, method, action = key
+            with self.subTest(view=viewset.__name__, action=action):
+                self.assertLessEqual(large, counts["small"][key])
+                budget = viewset.__dict__.get("query_budgets", {}).get(action)
+                if enforce_budgets and budget is not None:
+                    self.assertLessEqual(large, budget)
+
+    def get_routes(self):
+        """Router actions in an order that keeps the targets alive."""
+        routes = []
+        for _, viewset, basename in router.registry:
+            for route in router.get_routes(viewset):
+                mapping = router.get_method_map(viewset, route.mapping)
+                for method, action in mapping.items():
+                    if method not in viewset.http_method_names:
+                        continue
+                    routes.append(
+                        (
+                            action == "destroy",
+                            METHOD_ORDER.index(method),
+                            viewset,
+                            basename,
+                            route,
+                            method,
+                            action,
+                        )
+                    )
+        routes.sort(key=lambda route: route[:2])
+        return [route[2:] for route in routes]
+
+    def run_routes(self, params):
+        user = User.objects.get(email="perf-0@example.com")
+        client = APIClient()
+        client.force_authenticate(user=user)
+        targets = self.get_targets(user)
+        # Another user's links make recipe writes take every branch at
+        # both sizes, so only the data volume differs between them.
+        other = APIClient()
+        other.force_authenticate(user=User.objects.exclude(pk=user.pk)[0])
+        for link in ("favorite", "shopping-cart"):
+            other.post(reverse(f"recipe-{link}", args=(targets["recipe"],)))
+        counts = {}
+        for viewset, basename, route, method, action in self.get_routes():
+            url_name = route.name.format(basename=basename)
+            if route.detail:
+                url = reverse(url_name, args=(targets[basename],))
+            else:
+                url = reverse(url_name)
+            if method == "get":
+                url = f"{url}?limit={BUDGET_LIST_LIMIT}"
+            data = self.get_payload(basename, action, params)
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, method)(url, data, format="json")
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            self.assertLess(
+                response.status_code, 400, f"{method.upper()} {url}"
+            )
+            # Savepoints depend on the transaction the test runs in.
+            counts[(viewset, method, action)] = sum(
+                not query["sql"].startswith(SAVEPOINT_STATEMENTS)
+                for query in queries
+            )
+        return counts
+
+    def get_targets(self, user):
+        """Objects the detail routes of every basename act on."""
+        subscribed = Subscription.objects.filter(subscriber=user).values(
+            "subscribed_id"
+        )
+        return {
+            "recipe": Recipe.objects.filter(author=user)
+            .exclude(in_favorites=user)
+            .exclude(in_baskets=user)
+            .values_list("id", flat=True)
+            .first(),
+            "user": User.objects.exclude(pk=user.pk)
+            .exclude(pk__in=subscribed)
+            .values_list("id", flat=True)
+            .first(),
+            "ingredient": Ingredient.objects.values_list("id", flat=True)[0],
+            "tag": Tag.objects.values_list("id", flat=True)[0],
+        }
+
+    def get_payload(self, basename, action, params):
+        if basename == "recipe" and action in ("create", "partial_update"):
+            return {
+                "name": "Рецепт для проверки запросов",
+                "text": "Смешать.",
+                "cooking_time": 10,
+                "image": make_image(),
+                "tags": list(Tag.objects.values_list("id", flat=True)[:3]),
+                "ingredients": [
+                    {"id": ingredient_id, "amount": 1}
+                    for ingredient_id in Ingredient.objects.values_list(
+                        "id", flat=True
+                    )[: params["lines"]]
+                ],
+            }
+        if basename == "user" and action == "create":
+            return {
+                "email": "budget@example.com",
+                "username": "budget",
+                "first_name": "Бюджет",
+                "last_name": "Запросов",
+                "password": "budget-password",
+            }
+        return None
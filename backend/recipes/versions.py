@@ -0,0 +1,19 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+
+INGREDIENTS_VERSION_KEY = "versions:ingredients"
+TAGS_VERSION_KEY = "versions:tags"
+
+
+def get_version(key):
+    """Return the current version stamp stored in the shared cache."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, uuid4().hex, timeout=None)
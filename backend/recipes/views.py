@@ -1,8 +1,7 @@
-import csv
-
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import (
     AllowAny,
     IsAuthenticated,
@@ -10,14 +9,27 @@ from rest_framework.permissions import (
 )
 from rest_framework.response import Response
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Sum
-from django.http import HttpResponse
+from django.db.models import Exists, F, OuterRef, Q
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
+from backend.instrumentation import measure
+from backend.metrics import count_export_bytes
+from users.models import Subscription
 from users.paginators import CustomNumberPagination
 from users.permissions import IsOwnerOrReadOnlyForObject
-from .mixins import ListRetrieveGenericViewSet
-from .models import Ingredient, Recipe, Tag
+from .autocomplete import get_ingredient_index
+from .filters import IngredientSearchFilter
+from .fragments import (
+    apply_user_flags,
+    get_recipe_fragments,
+    render_fragments,
+)
+from .mixins import ListRetrieveGenericViewSet, PrecompressedListMixin
+from .models import CartItem, Favorite, Ingredient, Recipe, Tag
 from .serializers import (
     IngredientSerializer,
     RecipeFavoriteSerializer,
@@ -26,35 +38,84 @@ from .serializers import (
     RecipeUnsafeSerializer,
     TagSerializer,
 )
+from .services import whole_recipe_change
+from .shopping_cart import (
+    EXPORT_FORMATS,
+    cart_etag,
+    cart_last_modified,
+    get_export_format,
+    get_ingredient_amounts,
+)
+from .versions import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY
 
 User = get_user_model()
 
 
-class IngredientViewSet(ListRetrieveGenericViewSet):
+class IngredientViewSet(PrecompressedListMixin, ListRetrieveGenericViewSet):
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny,)
+    filter_backends = (IngredientSearchFilter,)
+    version_key = INGREDIENTS_VERSION_KEY
+    cache_query_params = (IngredientSearchFilter.search_param,)
 
-    SearchFilter.search_param = "name"
-    filter_backends = (SearchFilter,)
-    search_fields = ("^name",)
+    def get_uncached_list(self, request, *args, **kwargs):
+        search_filter = IngredientSearchFilter()
+        search_term = search_filter.get_search_term(request)
+        if not search_term or not settings.INGREDIENT_SEARCH_INDEX:
+            return super().get_uncached_list(request, *args, **kwargs)
+        ingredients = get_ingredient_index().search(
+            search_term,
+            search_filter.max_results,
+            search_filter.similarity_threshold,
+        )
+        return Response(ingredients)
 
 
-class TagViewSet(ListRetrieveGenericViewSet):
+class TagViewSet(PrecompressedListMixin, ListRetrieveGenericViewSet):
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     permission_classes = (AllowAny,)
+    version_key = TAGS_VERSION_KEY
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     pagination_class = CustomNumberPagination
+    ordering_param = "ordering"
+    orderings = {
+        "-favorites_count": ("-favorites_count", "-pub_date", "-id"),
+    }
+    # Counters change whenever a recipe is liked, so cursor pages over
+    # them would skip or repeat recipes.
+    cursor_unsafe_orderings = ("-favorites_count",)
+    default_ordering = ("-pub_date", "-id")
+    link_ordering = ("-added_at", "-link_id")
+    user_link_params = (
+        ("is_favorited", "favorites"),
+        ("is_in_shopping_cart", "cart_items"),
+    )
     http_method_names = ("get", "post", "patch", "delete")
     additional_methods = (
         "favorite",
         "favorite_delete",
         "shopping_cart",
         "shopping_cart_delete",
+        "download_shopping_cart",
     )
+    # Most SQL queries per action on SQLite, authentication and
+    # savepoints aside; enforced by recipes.tests.QueryBudgetTest.
+    query_budgets = {
+        "list": 5,
+        "retrieve": 5,
+        "create": 9,
+        "partial_update": 18,
+        "destroy": 14,
+        "favorite": 4,
+        "favorite_delete": 3,
+        "shopping_cart": 8,
+        "shopping_cart_delete": 6,
+        "download_shopping_cart": 2,
+    }
 
     def get_permissions(self):
         if self.action in RecipeViewSet.additional_methods:
@@ -73,47 +134,154 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         if self.action in RecipeViewSet.additional_methods:
             return Recipe.objects.all()
+        if self.action == "list":
+            return self.apply_query_param_filters(self.get_fragment_queryset())
         queryset = Recipe.objects.select_related("author").prefetch_related(
-            "ingredients_in_recipe__ingredient", "tags"
+            "ingredients_in_recipe", "tags"
+        )
+        return self.annotate_user_flags(queryset)
+
+    def get_user_link(self):
+        """Return the relation to the user's favorites or cart to list.
+
+        Such lists are read from the user's links, newest first, instead
+        of probing every recipe.
+        """
+        if not self.request.user.is_authenticated:
+            return None
+        for param, relation in self.user_link_params:
+            if self.request.query_params.get(param) == "1":
+                return relation
+        return None
+
+    def get_ordering(self):
+        ordering = self.request.query_params.get(self.ordering_param)
+        if ordering in self.orderings:
+            return self.orderings[ordering]
+        if self.get_user_link() is not None:
+            return self.link_ordering
+        return self.default_ordering
+
+    @property
+    def cursor_ordering(self):
+        ordering = self.request.query_params.get(self.ordering_param)
+        if ordering in self.cursor_unsafe_orderings:
+            raise ValidationError(
+                {
+                    self.ordering_param: (
+                        f"Сортировка {ordering} недоступна при "
+                        "pagination=cursor."
+                    )
+                }
+            )
+        return self.get_ordering()
+
+    def annotate_user_flags(self, queryset):
+        current_user = self.request.user
+        if not current_user.is_authenticated:
+            return queryset
+        is_favorited = Exists(
+            Favorite.objects.filter(user=current_user, recipe=OuterRef("pk"))
+        )
+        is_in_shopping_cart = Exists(
+            CartItem.objects.filter(user=current_user, recipe=OuterRef("pk"))
+        )
+        return queryset.annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        )
+
+    def get_fragment_queryset(self):
+        """Light rows with what cached fragments need: stamps and flags."""
+        queryset = self.annotate_user_flags(
+            Recipe.objects.only(
+                "id", "author_id", "pub_date", "updated_at", "favorites_count"
+            )
+        )
+        current_user = self.request.user
+        if not current_user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(
+                    subscriber=current_user, subscribed=OuterRef("author_id")
+                )
+            )
         )
-        if self.action == "list":
-            return self.apply_query_param_filters(queryset)
-        return queryset
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+        with measure("serializer"):
+            fragments = get_recipe_fragments(recipes, render_fragments)
+            data = [
+                apply_user_flags(request, fragments[recipe.id], recipe)
+                for recipe in recipes
+                if recipe.id in fragments
+            ]
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = get_object_or_404(
+            self.get_fragment_queryset(), pk=self.kwargs[self.lookup_field]
+        )
+        self.check_object_permissions(request, recipe)
+        with measure("serializer"):
+            fragment = get_recipe_fragments((recipe,), render_fragments)
+            data = apply_user_flags(request, fragment[recipe.id], recipe)
+        return Response(data)
 
     def apply_query_param_filters(self, queryset):
-        is_authenticated = self.request.user.is_authenticated
         author = self.request.query_params.get("author")
         if author and author.isdigit():
             queryset = queryset.filter(Q(author=int(author)))
 
-        is_favorited = self.request.query_params.get("is_favorited")
-        if is_authenticated and is_favorited and is_favorited == "1":
-            queryset = queryset.filter(Q(in_favorites=self.request.user))
+        link = self.get_user_link()
+        if link is not None:
+            queryset = queryset.filter(
+                **{f"{link}__user": self.request.user}
+            ).annotate(
+                added_at=F(f"{link}__created_at"), link_id=F(f"{link}__id")
+            )
 
         is_in_cart = self.request.query_params.get("is_in_shopping_cart")
-        if is_authenticated and is_in_cart and is_in_cart == "1":
-            queryset = queryset.filter(Q(in_baskets=self.request.user))
+        if link == "favorites" and is_in_cart == "1":
+            queryset = queryset.filter(is_in_shopping_cart=True)
 
         tags = self.request.query_params.getlist("tags")
         if tags:
-            filter_tags = Q(tags__slug=tags[0])
-            for tag in tags[1:]:
-                filter_tags = filter_tags | Q(tags__slug=tag)
-            queryset = queryset.filter(filter_tags)
-        return queryset.distinct()
+            queryset = queryset.filter(
+                Exists(
+                    Recipe.tags.through.objects.filter(
+                        recipe=OuterRef("pk"), tag__slug__in=tags
+                    )
+                )
+            )
+        return queryset.order_by(*self.get_ordering())
+
+    def perform_destroy(self, instance):
+        # Carts lose the recipe as a whole on pre_delete, so its lines,
+        # deleted one by one, need not look their carts up.
+        with whole_recipe_change(instance):
+            instance.delete()
 
     @action(detail=True, methods=("post",))
     def favorite(self, request, pk=None):
         serializer = self.get_serializer(data={"recipe_id": pk})
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with measure("serializer"):
+            data = serializer.data
+        return Response(data, status=status.HTTP_200_OK)
 
     @favorite.mapping.delete
     def favorite_delete(self, request, pk=None):
         serializer = self.get_serializer(data={"recipe_id": pk})
         serializer.is_valid(raise_exception=True)
-        serializer.instance.in_favorites.remove(request.user)
+        serializer.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=("post",))
@@ -121,30 +289,39 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data={"recipe_id": pk})
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with measure("serializer"):
+            data = serializer.data
+        return Response(data, status=status.HTTP_200_OK)
 
     @shopping_cart.mapping.delete
     def shopping_cart_delete(self, request, pk=None):
         serializer = self.get_serializer(data={"recipe_id": pk})
         serializer.is_valid(raise_exception=True)
-        serializer.instance.in_baskets.remove(request.user)
+        serializer.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False)
     def download_shopping_cart(self, request):
-        current_user = request.user
-        ingredient_amount = (
-            Ingredient.objects.filter(
-                ingredients_in_recipe__recipe__in_baskets=current_user
+        export_format = get_export_format(request)
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"file_format": ["Неподдерживаемый формат файла."]}
             )
-            .values_list("name", "measurement_unit")
-            .annotate(amount=Sum("ingredients_in_recipe__amount"))
+        return self.export_shopping_cart(request, export_format)
+
+    @method_decorator(
+        condition(etag_func=cart_etag, last_modified_func=cart_last_modified)
+    )
+    def export_shopping_cart(self, request, export_format):
+        content_type, render = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            render(get_ingredient_amounts(request.user)),
+            content_type=content_type,
         )
-        response = HttpResponse(content_type="text/csv")
         response[
             "Content-Disposition"
-        ] = "attachment; filename=ingredients.csv"
-        writer = csv.writer(response)
-        for name, unit, amount in ingredient_amount:
-            writer.writerow([name, amount, unit])
+        ] = f"attachment; filename=ingredients.{export_format}"
+        response.streaming_content = count_export_bytes(
+            response.streaming_content, export_format
+        )
         return response
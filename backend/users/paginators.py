@@ -1,6 +1,59 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class CustomCursorPagination(CursorPagination):
+    page_size_query_param = "limit"
+    max_page_size = 100
+    count_query_param = "count"
+
+    def get_ordering(self, request, queryset, view):
+        return view.cursor_ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "1":
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        fields = [
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]
+        if self.count is not None:
+            fields.insert(0, ("count", self.count))
+        return Response(OrderedDict(fields))
 
 
 class CustomNumberPagination(PageNumberPagination):
+    """Page number pagination with an opt-in keyset mode.
+
+    ``?pagination=cursor`` switches views that define ``cursor_ordering``
+    to cursor pagination, which needs neither OFFSET nor COUNT(*). The
+    ordering must not change while a client pages through it, or pages
+    skip and repeat rows, so views refuse cursors over counters.
+    """
+
     page_size_query_param = "limit"
     max_page_size = 100
+    mode_query_param = "pagination"
+    cursor_pagination_class = CustomCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        use_cursor = request.query_params.get(self.mode_query_param)
+        if use_cursor == "cursor" and hasattr(view, "cursor_ordering"):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
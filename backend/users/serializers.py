@@ -3,10 +3,11 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from django.db.models import Count
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
-from .models import Subscription
+from .services import subscribe, unsubscribe
+from .utils import get_subscribed_ids
 
 User = get_user_model()
 
@@ -33,15 +34,12 @@ class UserSerializer(serializers.ModelSerializer):
         }
 
     def get_is_subscribed(self, user):
-        current_user = self.context.get("request").user
-        if not current_user.is_authenticated:
+        request = self.context.get("request")
+        if not request.user.is_authenticated:
             return False
         if hasattr(user, "is_subscribed"):
             return user.is_subscribed
-        return (
-            current_user != user
-            and user.subscribers.filter(subscriber=current_user).exists()
-        )
+        return user.id in get_subscribed_ids(request)
 
     def validate(self, data):
         user = User(**data)
@@ -70,8 +68,11 @@ class UserForSubscriptionSerializer(UserSerializer):
     def get_recipes(self, user):
         from recipes.serializers import RecipeShortPresentSerializer
 
-        limit = self.context.get("view").get_recipes_limit()
-        queryset = user.own_recipes.all()[:limit]
+        if hasattr(user, "recent_recipes"):
+            queryset = user.recent_recipes
+        else:
+            limit = self.context.get("view").get_recipes_limit()
+            queryset = user.own_recipes.all()[:limit]
         return RecipeShortPresentSerializer(
             queryset,
             many=True,
@@ -84,31 +85,21 @@ class AddSubscriptionSerializer(serializers.Serializer):
     subscribed = serializers.IntegerField()
 
     def validate(self, data):
-        subscriber_id = data.get("subscriber")
-        subscribed_id = data.get("subscribed")
-        get_object_or_404(User, pk=subscribed_id)
-        if subscriber_id == subscribed_id:
+        if data.get("subscriber") == data.get("subscribed"):
             raise ValidationError(
                 {"errors": "Нельзя подписаться на самого себя."}
             )
-        if Subscription.objects.filter(
-            subscribed_id=subscribed_id, subscriber_id=subscriber_id
-        ).exists():
-            raise ValidationError(
-                {"errors": "Вы уже подписаны на этого пользователя."}
-            )
         return data
 
     def create(self, validated_data):
-        subscriber_id = validated_data.get("subscriber")
-        subscribed_id = validated_data.get("subscribed")
-        Subscription.objects.create(
-            subscribed_id=subscribed_id,
-            subscriber_id=subscriber_id,
-        )
-        user = User.objects.annotate(recipes_count=Count("own_recipes")).get(
-            pk=subscribed_id
-        )
+        current_user = self.context.get("request").user
+        user, created = subscribe(current_user, validated_data["subscribed"])
+        if user is None:
+            raise Http404
+        if not created:
+            raise serializers.ValidationError(
+                {"errors": ["Вы уже подписаны на этого пользователя."]}
+            )
         user.is_subscribed = True
         return user
 
@@ -123,16 +114,11 @@ class DelSubscriptionSerializer(serializers.Serializer):
     subscriber = serializers.IntegerField()
     subscribed = serializers.IntegerField()
 
-    def validate(self, data):
-        subscriber_id = data.get("subscriber")
-        subscribed_id = data.get("subscribed")
-        get_object_or_404(User, pk=subscribed_id)
-        subscription = Subscription.objects.filter(
-            subscriber=subscriber_id, subscribed=subscribed_id
-        ).first()
-        if not subscription:
-            raise ValidationError(
-                {"errors": "Вы не подписаны на этого пользователя."}
+    def delete(self):
+        current_user = self.context.get("request").user
+        subscribed_id = self.validated_data["subscribed"]
+        if not unsubscribe(current_user, subscribed_id):
+            get_object_or_404(User, pk=subscribed_id)
+            raise serializers.ValidationError(
+                {"errors": ["Вы не подписаны на этого пользователя."]}
             )
-        self.subscription = subscription
-        return data
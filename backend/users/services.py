@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Subscription
+
+User = get_user_model()
+
+SUBSCRIBE_SQL = """
+WITH subscribed AS (
+    INSERT INTO {subscription} (subscribed_id, subscriber_id)
+    SELECT id, %s FROM {user} WHERE id = %s
+    ON CONFLICT (subscribed_id, subscriber_id) DO NOTHING
+    RETURNING subscribed_id
+)
+SELECT author.*, EXISTS (SELECT 1 FROM subscribed) AS created
+FROM ({author}) author
+"""
+
+
+def subscribe(subscriber, author_id):
+    """Subscribe to the author and return them with ``recipes_count``.
+
+    Returns ``(None, False)`` if there is no such author. On PostgreSQL
+    the subscription and the author are handled by one statement.
+    """
+    authors = User.objects.filter(pk=author_id).annotate(
+        recipes_count=Count("own_recipes")
+    )
+    if connection.vendor == "postgresql":
+        quote_name = connection.ops.quote_name
+        author_sql, author_params = authors.query.sql_with_params()
+        sql = SUBSCRIBE_SQL.format(
+            subscription=quote_name(Subscription._meta.db_table),
+            user=quote_name(User._meta.db_table),
+            author=author_sql,
+        )
+        author = next(
+            iter(
+                User.objects.raw(
+                    sql, (subscriber.id, author_id, *author_params)
+                )
+            ),
+            None,
+        )
+        return author, bool(author and author.created)
+    with transaction.atomic():
+        author = authors.first()
+        if author is None:
+            return None, False
+        _, created = Subscription.objects.get_or_create(
+            subscribed=author, subscriber=subscriber
+        )
+    return author, created
+
+
+def unsubscribe(subscriber, author_id):
+    """Delete the subscription, returning whether there was one."""
+    deleted, _ = Subscription.objects.filter(
+        subscribed_id=author_id, subscriber=subscriber
+    ).delete()
+    return bool(deleted)
@@ -0,0 +1,217 @@
+from unittest import skipUnless
+
+from rest_framework.test import APITestCase
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Recipe
+from .models import Subscription
+from .services import SUBSCRIBE_SQL, subscribe
+
+User = get_user_model()
+
+
+class SubscriptionFlagTest(APITestCase):
+    """``is_subscribed`` is read with one query per request."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            email="follower@example.com", username="follower", password="pass"
+        )
+        cls.authors = [
+            User.objects.create_user(
+                email=f"writer-{number}@example.com",
+                username=f"writer-{number}",
+                password="pass",
+            )
+            for number in range(4)
+        ]
+        for author in cls.authors[::2]:
+            Subscription.objects.create(
+                subscriber=cls.reader, subscribed=author
+            )
+
+    def get_flags(self, limit):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/users/", {"limit": limit})
+        self.assertEqual(response.status_code, 200)
+        return {
+            user["id"]: user["is_subscribed"]
+            for user in response.data["results"]
+        }
+
+    def test_users_list(self):
+        self.client.force_authenticate(user=self.reader)
+        expected = {self.reader.id: False}
+        expected.update(
+            (author.id, number % 2 == 0)
+            for number, author in enumerate(self.authors)
+        )
+        self.assertEqual(self.get_flags(5), expected)
+        self.assertEqual(
+            self.get_flags(2),
+            {self.reader.id: False, self.authors[0].id: True},
+        )
+
+    def test_anonymous_users_list(self):
+        response = self.client.get("/api/users/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            any(user["is_subscribed"] for user in response.data["results"])
+        )
+
+    def test_me_and_profile(self):
+        self.client.force_authenticate(user=self.reader)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/users/me/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["id"], self.reader.id)
+        self.assertIs(response.data["is_subscribed"], False)
+        response = self.client.get(f"/api/users/{self.authors[0].id}/")
+        self.assertIs(response.data["is_subscribed"], True)
+
+
+class SubscriptionRecipesTest(APITestCase):
+    """Subscriptions list the newest ``recipes_limit`` recipes per author."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            email="subscriber@example.com",
+            username="subscriber",
+            password="pass",
+        )
+        cls.recipe_ids = {}
+        for number, recipes in enumerate((5, 2, 0)):
+            author = User.objects.create_user(
+                email=f"chef-{number}@example.com",
+                username=f"chef-{number}",
+                password="pass",
+            )
+            Subscription.objects.create(
+                subscriber=cls.reader, subscribed=author
+            )
+            cls.recipe_ids[author.id] = [
+                Recipe.objects.create(
+                    author=author,
+                    name=f"Блюдо {number}-{position}",
+                    text="Приготовить.",
+                    cooking_time=5,
+                    image="recipes/images/test.png",
+                ).id
+                for position in range(recipes)
+            ][::-1]
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.reader)
+
+    def get_subscriptions(self, **params):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/users/subscriptions/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_recipes_limit(self):
+        counts = {
+            author_id: len(recipe_ids)
+            for author_id, recipe_ids in self.recipe_ids.items()
+        }
+        for params, cut in (
+            ({"recipes_limit": "3"}, 3),
+            ({"recipes_limit": "1"}, 1),
+            ({"recipes_limit": "abc"}, 20),
+            ({}, 20),
+        ):
+            with self.subTest(**params):
+                authors = self.get_subscriptions(**params)
+                recipes = {
+                    author["id"]: [
+                        recipe["id"] for recipe in author["recipes"]
+                    ]
+                    for author in authors
+                }
+                self.assertEqual(
+                    recipes,
+                    {
+                        author_id: recipe_ids[:cut]
+                        for author_id, recipe_ids in self.recipe_ids.items()
+                    },
+                )
+                self.assertEqual(
+                    {
+                        author["id"]: author["recipes_count"]
+                        for author in authors
+                    },
+                    counts,
+                )
+
+    def test_queries_do_not_grow_with_page_size(self):
+        for limit in (1, 3):
+            with self.subTest(limit=limit):
+                authors = self.get_subscriptions(limit=limit, recipes_limit=2)
+                self.assertEqual(len(authors), limit)
+
+
+class SubscriptionToggleTest(APITestCase):
+    """Subscribing twice or unsubscribing twice is refused."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            email="reader@example.com", username="reader", password="pass"
+        )
+        cls.author = User.objects.create_user(
+            email="author@example.com", username="author", password="pass"
+        )
+        Recipe.objects.create(
+            author=cls.author,
+            name="Каша",
+            text="Сварить.",
+            cooking_time=15,
+            image="recipes/images/test.png",
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.reader)
+        self.url = f"/api/users/{self.author.id}/subscribe/"
+
+    def test_repeated_toggles_are_rejected(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["recipes_count"], 1)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("errors", response.data)
+        self.assertEqual(Subscription.objects.count(), 1)
+
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        response = self.client.delete(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("errors", response.data)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_unknown_author(self):
+        url = "/api/users/9001/subscribe/"
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+
+
+@skipUnless(connection.vendor == "postgresql", "PostgreSQL statements")
+class SubscribeStatementTest(SubscriptionToggleTest):
+    """On PostgreSQL subscribing is a single statement."""
+
+    def test_single_statement(self):
+        for created in (True, False):
+            with CaptureQueriesContext(connection) as queries:
+                author, result = subscribe(self.reader, self.author.id)
+            self.assertEqual(len(queries), 1)
+            self.assertEqual(
+                queries[0]["sql"].split()[:2], SUBSCRIBE_SQL.split()[:2]
+            )
+            self.assertEqual(result, created)
+            self.assertEqual(author.recipes_count, 1)
+        self.assertEqual(Subscription.objects.count(), 1)
+        self.assertEqual(subscribe(self.reader, 9001), (None, False))
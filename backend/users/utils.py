@@ -0,0 +1,17 @@
+from .models import Subscription
+
+
+def get_subscribed_ids(request):
+    """Return ids of authors the current user follows, cached per request."""
+    if not hasattr(request, "subscribed_ids"):
+        current_user = request.user
+        request.subscribed_ids = (
+            set(
+                Subscription.objects.filter(
+                    subscriber=current_user
+                ).values_list("subscribed_id", flat=True)
+            )
+            if current_user.is_authenticated
+            else set()
+        )
+    return request.subscribed_ids
@@ -1,14 +1,15 @@
-from rest_framework import mixins, status, validators, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db.models import Count, Exists, OuterRef, Prefetch
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
 
+from backend.instrumentation import measure
 from recipes.models import Recipe
-from .models import Subscription
 from .paginators import CustomNumberPagination
 from .serializers import (
     AddSubscriptionSerializer,
@@ -27,6 +28,18 @@ class UserViewSet(
     viewsets.GenericViewSet,
 ):
     pagination_class = CustomNumberPagination
+    cursor_ordering = ("id",)
+    # Most SQL queries per action on SQLite, authentication and
+    # savepoints aside; enforced by recipes.tests.QueryBudgetTest.
+    query_budgets = {
+        "list": 3,
+        "retrieve": 2,
+        "create": 4,
+        "me": 1,
+        "subscriptions": 3,
+        "subscribe": 4,
+        "subscribe_delete": 1,
+    }
 
     def perform_create(self, serializer):
         password = serializer.validated_data.pop("password")
@@ -49,25 +62,13 @@ class UserViewSet(
 
     def get_queryset(self):
         current_user = self.request.user
-        recipes = Recipe.objects.all()
-        prefetch_recipes = Prefetch("own_recipes", queryset=recipes)
         if self.action == "subscriptions":
             return (
                 User.objects.filter(subscribers__subscriber=current_user)
                 .annotate(recipes_count=Count("own_recipes"))
-                .prefetch_related(prefetch_recipes)
                 .order_by("id")
             )
-        if self.action == "list":
-            if not current_user.is_authenticated:
-                return User.objects.all()
-            is_subscribed = Exists(
-                Subscription.objects.filter(
-                    subscribed=OuterRef("pk"), subscriber=current_user
-                )
-            )
-            return User.objects.annotate(is_subscribed=is_subscribed)
-        return User.objects.all()
+        return User.objects.order_by("id")
 
     def get_recipes_limit(self):
         limit = self.request.query_params.get("recipes_limit", None)
@@ -75,11 +76,43 @@ class UserViewSet(
             return int(limit)
         return 20
 
+    def attach_recent_recipes(self, authors):
+        """Fetch the newest recipes of every author in one windowed query."""
+        if not authors:
+            return
+        ranked = (
+            Recipe.objects.filter(author__in=authors)
+            .only(
+                "id", "author", "name", "image", "renditions", "cooking_time"
+            )
+            .annotate(
+                recipe_rank=Window(
+                    expression=RowNumber(),
+                    partition_by=F("author_id"),
+                    order_by=(F("pub_date").desc(), F("id").desc()),
+                )
+            )
+            .order_by()
+        )
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f"SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s "
+            "ORDER BY author_id, recipe_rank",
+            (*params, self.get_recipes_limit()),
+        )
+        recent_recipes = {author.id: [] for author in authors}
+        for recipe in recipes:
+            recent_recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recent_recipes = recent_recipes[author.id]
+
     @action(detail=False)
     def me(self, request):
         user = request.user
         serializer = self.get_serializer(instance=user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with measure("serializer"):
+            data = serializer.data
+        return Response(data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=("post",))
     def subscribe(self, request, pk=None):
@@ -88,7 +121,9 @@ class UserViewSet(
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with measure("serializer"):
+            data = serializer.data
+        return Response(data, status=status.HTTP_200_OK)
 
     @subscribe.mapping.delete
     def subscribe_delete(self, request, pk=None):
@@ -96,9 +131,15 @@ class UserViewSet(
             data={"subscriber": request.user.id, "subscribed": pk}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.subscription.delete()
+        serializer.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False)
     def subscriptions(self, request):
-        return self.list(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        self.attach_recent_recipes(page)
+        serializer = self.get_serializer(page, many=True)
+        with measure("serializer"):
+            data = serializer.data
+        return self.get_paginated_response(data)